@@ -1,12 +1,16 @@
 import numpy as np
 from astropy.io import fits
 from astropy.table import Table
-import itur
 import utils
 
 
+# Changes in elevation (deg), ambient temperature (C), pressure (hPa) and 
+# humidity (%) beyond which the approximate mode places a new model knot
+KNOT_TOLERANCES = {"ELEVATIO": 0.5, "TAMBIENT": 0.5, "PRESSURE": 1.0, "HUMIDITY": 2.0}
+
+
 class Atmosphere_Correction:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, cache=None):
         '''
         Initialization function for provided file. Responsible for 
         opening the SDFITS file's header and data and initializing 
@@ -14,13 +18,28 @@ class Atmosphere_Correction:
         '''
 
         self.filepath = file_path
+        self.cache = cache
+        self.output_path = utils.stage_path(self.filepath, "corrected")
+
+        self.header = None
+        self.data = None
+
+        # With a cache the file is only loaded once the cache has been checked
+        if self.cache is None:
+            self._load()
+
+    def _load(self):
+        '''
+        Open the SDFITS file's header and data.
+        '''
 
         with fits.open(self.filepath) as hdul:            
-            # Use astropy's built in verification methods
-            hdul.verify('exception')
+            # Use astropy's built in verification methods unless the pipeline already stamped the file
+            utils.verify(hdul)
 
             self.header = hdul[0].header
             self.data = Table(hdul[1].data)    
+            self.data['DATA'] = utils.as_cube(self.data['DATA'])
     
     def _get_water_vapor_density(self, temperature, relative_humidity):
         '''
@@ -51,44 +70,193 @@ class Atmosphere_Correction:
         Radiocommunication standard library.
         '''
 
+        # itur is slow to import, so it is only loaded once a correction actually runs
+        import itur
+
         g = itur.models.itu676.gaseous_attenuation_slant_path(frequencies, elevation, water_vapor_density, pressure, temperature, V_t=None, h=None, mode='approx')
         transmission = 10 ** (-(g.value) / 10.0)
 
         return transmission
 
-    def atmosphere_correction(self):
+    def _row_transmission(self, frequencies, row):
+        '''
+        Evaluate the transmission across all channels for the weather 
+        parameters and elevation of a single row.
+        '''
+
+        # Pull relevant parameters
+        elevation = row["ELEVATIO"]
+        temperature = row["TAMBIENT"] + 273.15 # SDFITS provide ambient temperature, so it is converted to Kelvin
+        pressure = row["PRESSURE"]
+        relative_humidity = row["HUMIDITY"]
+        water_vapor_density = self._get_water_vapor_density(temperature, relative_humidity)
+
+        gaseous_transmission = self._gaseous_attenuation_correction(frequencies, elevation, water_vapor_density, pressure, temperature)
+
+        # This has been structured to accomodate additional transmission functions like 
+        # cloud_attenuation if the appropriate instruments are installed. The transmissions 
+        # would the be multiplicative.
+
+        return gaseous_transmission
+
+    def _select_knots(self, rows, tolerances):
+        '''
+        Place a knot at the first and last rows and wherever elevation or 
+        a weather parameter has moved beyond its tolerance since the last knot.
+        '''
+
+        columns = {column: np.asarray(self.data[column])[rows] for column in tolerances}
+
+        knots = [0]
+        for j in range(1, len(rows)):
+            if any(abs(columns[column][j] - columns[column][knots[-1]]) > tolerance for column, tolerance in tolerances.items()):
+                knots.append(j)
+
+        if knots[-1] != len(rows) - 1:
+            knots.append(len(rows) - 1)
+
+        return knots
+
+    def _interpolated_transmission(self, frequencies, rows, times, tolerances, transmission_tolerance):
+        '''
+        Evaluate the model only at knot rows and linearly interpolate each 
+        channel's transmission in time for the rows in between. Every interval 
+        is checked against an exact evaluation at its midpoint and split until 
+        the interpolation error is within transmission_tolerance.
+        '''
+
+        exact = {j: self._row_transmission(frequencies, self.data[rows[j]]) for j in self._select_knots(rows, tolerances)}
+
+        knots = sorted(exact)
+        intervals = list(zip(knots[:-1], knots[1:]))
+        max_error = 0.0
+
+        while intervals:
+            a, b = intervals.pop()
+            if b - a < 2:
+                continue
+
+            # Compare interpolation at the middle row with an exact evaluation
+            m = (a + b) // 2
+            exact[m] = self._row_transmission(frequencies, self.data[rows[m]])
+
+            weight = (times[m] - times[a]) / (times[b] - times[a]) if times[b] != times[a] else 0.0
+            error = np.max(np.abs(exact[a] * (1 - weight) + exact[b] * weight - exact[m]))
+
+            if error > transmission_tolerance:
+                intervals.extend([(a, m), (m, b)])
+            else:
+                max_error = max(max_error, error)
+
+        knots = np.array(sorted(exact))
+        knot_times = times[knots]
+        knot_transmissions = np.array([exact[j] for j in knots])
+
+        # Interpolate every channel at once between the surrounding knots
+        left = np.clip(np.searchsorted(knot_times, times, side='right') - 1, 0, max(len(knots) - 2, 0))
+        right = np.minimum(left + 1, len(knots) - 1)
+        span = knot_times[right] - knot_times[left]
+        weight = np.divide(times - knot_times[left], span, out=np.zeros(len(times)), where=span != 0)
+
+        transmission = knot_transmissions[left] * (1 - weight[:, np.newaxis]) + knot_transmissions[right] * weight[:, np.newaxis]
+
+        return transmission, len(exact), max_error
+
+    def atmosphere_correction(self, channel_index=False, approximate=False, tolerances=None, transmission_tolerance=1e-4):
         '''
         Loop through each spectrum and apply the atmosphere correction. 
         Weather parameters and elevation change during an observation, so 
-        they must be corrected for time dependent.
+        they must be corrected for time dependent. The channel prefix-sum 
+        index is rebuilt for the corrected file if requested.
+
+        In approximate mode the model is only evaluated at knot times and 
+        interpolated in between. The number of model evaluations and the 
+        largest interpolation error measured against exact evaluations are 
+        kept in model_evaluations and max_interpolation_error.
         '''
 
-        for i in self.data:
-            frequencies = utils.get_frequency_range(self.header, i["IFNUM"])
-            frequencies = np.linspace(frequencies[1] / 1000, frequencies[0] / 1000, frequencies[2])
+        if tolerances is None:
+            tolerances = KNOT_TOLERANCES
+
+        self.model_evaluations = 0
+        self.max_interpolation_error = 0.0
+
+        # Leave the output of an earlier run on this exact file as it is and 
+        # only rebuild its index if that is missing
+        if self.cache is not None:
+            key = self.cache.key(
+                self.filepath, "corrected", precision=utils.PRECISION,
+                approximate=approximate, tolerances=tolerances, transmission_tolerance=transmission_tolerance
+            )
+            cached = self.cache.get_output(key, self.output_path)
+
+            if cached is not None:
+                # Report the statistics of the run that wrote the output
+                self.model_evaluations = cached["model_evaluations"]
+                self.max_interpolation_error = cached["max_interpolation_error"]
 
-            # Pull relevant parameters
-            elevation = i["ELEVATIO"]
-            temperature = i["TAMBIENT"] + 273.15 # SDFITS provide ambient temperature, so it is converted to Kelvin
-            pressure = i["PRESSURE"]
-            relative_humidity = i["HUMIDITY"]
-            water_vapor_density = self._get_water_vapor_density(temperature, relative_humidity)
+                if channel_index and not utils.has_channel_index(self.output_path):
+                    utils.save_channel_index(self.output_path, Table.read(self.output_path, hdu=1))
+                return
 
-            gaseous_transmission = self._gaseous_attenuation_correction(frequencies, elevation, water_vapor_density, pressure, temperature)
+        if self.data is None:
+            self._load()
 
-            # This has been structured to accomodate additional transmission functions like 
-            # cloud_attenuation if the appropriate instruments are installed. The transmissions 
-            # would the be multiplicative.
+        if approximate:
+            times = utils.relative_times(self.header, self.data)
+
+            # Each feed and polarization is its own time series with its own frequency axis
+            for ifnum in np.unique(self.data["IFNUM"]):
+                frequencies = utils.get_frequency_range(self.header, ifnum)
+                frequencies = np.linspace(frequencies[1] / 1000, frequencies[0] / 1000, frequencies[2])
+
+                for plnum in np.unique(self.data["PLNUM"]):
+                    rows = np.flatnonzero((self.data["IFNUM"] == ifnum) & (self.data["PLNUM"] == plnum))
+                    if len(rows) == 0:
+                        continue
+
+                    rows = rows[np.argsort(times[rows], kind="stable")]
+
+                    gaseous_transmission, evaluations, error = self._interpolated_transmission(frequencies, rows, times[rows], tolerances, transmission_tolerance)
+                    self.model_evaluations += evaluations
+                    self.max_interpolation_error = max(self.max_interpolation_error, error)
+
+                    # Inversely apply the transmission to model initial signal.
+                    self.data["DATA"][rows] = np.asarray(self.data["DATA"][rows]) / gaseous_transmission
+        else:
+            for i in self.data:
+                frequencies = utils.get_frequency_range(self.header, i["IFNUM"])
+                frequencies = np.linspace(frequencies[1] / 1000, frequencies[0] / 1000, frequencies[2])
+
+                gaseous_transmission = self._row_transmission(frequencies, i)
+                self.model_evaluations += 1
+
+                # Inversely apply the transmission to model initial signal.
+                i["DATA"] *= (1 / gaseous_transmission)
+
+        self._save(channel_index)
+
+        if self.cache is not None:
+            self.cache.put_output(
+                key, self.output_path,
+                model_evaluations=self.model_evaluations, max_interpolation_error=self.max_interpolation_error
+            )
+
+    def _save(self, channel_index):
+        '''
+        Save the corrected file and optionally its channel prefix-sum index.
+        '''
 
-            # Inversely apply the transmission to model initial signal.
-            i["DATA"] *= (1 / gaseous_transmission)
+        output_path = utils.save(self.filepath, self.header, self.data, "corrected")
 
-        utils.save(self.filepath, self.header, self.data, "corrected")
+        if channel_index:
+            utils.save_channel_index(output_path, self.data)
 
 
 if __name__ == "__main__":
     filepath = "C:/Users/starb/Downloads/0144767_validated.fits"
     
     ac = Atmosphere_Correction(filepath)
-    ac.atmosphere_correction()
+    ac.atmosphere_correction(approximate=True)
+    print("Model evaluations:", ac.model_evaluations, " Max interpolation error:", ac.max_interpolation_error)
     
\ No newline at end of file
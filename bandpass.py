@@ -0,0 +1,80 @@
+import numpy as np
+import utils
+
+
+class Bandpass:
+    def __init__(self, header, data, channel_count, clip: float = 3.0, iterations: int = 5):
+        '''
+        Initialization function for the provided rows of a single feed and
+        polarization, including their calibration spikes. Derives the
+        per-channel calibration unit factor from the noise diode.
+        '''
+
+        self.header = header
+        self.clip = clip
+        self.iterations = iterations
+
+        # The pre- and post-calibration spikes bracket the observation
+        data_start_index, post_cal_start_index, off_start_index = utils.find_calibrations(header, data, channel_count)
+
+        self.pre_delta = self._calibration_delta(data[:data_start_index])
+        self.post_delta = self._calibration_delta(data[post_cal_start_index:])
+
+        deltas = [delta for delta in (self.pre_delta, self.post_delta) if delta is not None]
+        if not deltas:
+            raise ValueError("No calibration spikes with enough diode on and off rows to calibrate the bandpass")
+
+        # Average the available spikes. Channels with no positive diode step keep a 
+        # factor of 1, so they stay in their input units, and are flagged in uncalibrated.
+        self.delta = np.mean(deltas, axis=0)
+        self.uncalibrated = ~(np.isfinite(self.delta) & (self.delta > 0))
+        self.factor = np.divide(1.0, self.delta, out=np.ones(len(self.delta)), where=~self.uncalibrated)
+
+    def _robust_mean(self, cube):
+        '''
+        Sigma-clipped mean of every channel, computed across rows
+        for all channels at once.
+        '''
+
+        values = np.asarray(cube, dtype=np.float64)
+        finite = np.isfinite(values)
+        mask = finite
+
+        for _ in range(self.iterations):
+            masked = np.where(mask, values, np.nan)
+
+            # Robust center and standard deviation of each channel
+            center = np.nanmedian(masked, axis=0)
+            sigma = 1.4826 * np.nanmedian(np.abs(masked - center), axis=0)
+
+            new_mask = finite & (np.abs(values - center) <= self.clip * sigma)
+            if np.array_equal(new_mask, mask):
+                break
+
+            mask = new_mask
+
+        return np.nanmean(np.where(mask, values, np.nan), axis=0)
+
+    def _calibration_delta(self, calibration):
+        '''
+        Per-channel difference between the diode on and off rows of a
+        calibration spike.
+        '''
+
+        diode_on, diode_off = utils.parse_calibration_spike(calibration)
+
+        # Match the minimum section length used for the continuum diode fits
+        if len(diode_on) < 4 or len(diode_off) < 4:
+            return None
+
+        return self._robust_mean(diode_on['DATA']) - self._robust_mean(diode_off['DATA'])
+
+    def apply(self, cube):
+        '''
+        Convert a cube (rows x channels) or spectrum into calibration units. 
+        Channels flagged in uncalibrated are left unchanged.
+        '''
+
+        cube = np.asarray(cube)
+
+        return cube * self.factor.astype(cube.dtype)
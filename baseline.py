@@ -0,0 +1,127 @@
+import numpy as np
+
+
+class Baseline:
+    def __init__(self, order: int = 1, kind: str = "polynomial", knots: int = 4, line_free_ranges=None,
+                 per_integration: bool = False, clip: float = 3.0, iterations: int = 5, chunk_size: int = 4096):
+        '''
+        Initialization function for a spectral baseline. The baseline is a
+        Legendre polynomial of the given order or a B-spline of that degree
+        with the given number of interior knots. It is fit over the line-free
+        channels, either the provided frequency ranges or channels found by
+        iterative sigma clipping.
+        '''
+
+        if kind not in ("polynomial", "spline"):
+            raise ValueError(f"Unknown baseline kind: {kind}")
+
+        self.order = order
+        self.kind = kind
+        self.knots = knots
+        self.line_free_ranges = line_free_ranges
+        self.per_integration = per_integration
+        self.clip = clip
+        self.iterations = iterations
+        self.chunk_size = chunk_size
+
+        # Set by the most recent subtraction
+        self.line_free_mask = None
+        self.coefficients = None
+
+    def __repr__(self):
+        return (
+            f"Baseline(order={self.order}, kind={self.kind!r}, knots={self.knots}, line_free_ranges={self.line_free_ranges}, "
+            f"per_integration={self.per_integration}, clip={self.clip}, iterations={self.iterations})"
+        )
+
+    def _design_matrix(self, frequencies):
+        '''
+        Evaluate every basis function at every channel.
+        '''
+
+        # Map the frequency axis onto [-1, 1] to keep the basis well conditioned
+        low, high = np.min(frequencies), np.max(frequencies)
+        x = (2 * (frequencies - low) / (high - low)) - 1 if high > low else np.zeros(len(frequencies))
+
+        if self.kind == "polynomial":
+            return np.polynomial.legendre.legvander(x, self.order)
+
+        # scipy is only needed for spline baselines, so it is loaded on first use
+        from scipy.interpolate import BSpline
+
+        interior = np.linspace(-1, 1, self.knots + 2)[1:-1]
+        t = np.concatenate(([-1.0] * (self.order + 1), interior, [1.0] * (self.order + 1)))
+
+        return BSpline.design_matrix(x, t, self.order).toarray()
+
+    def _find_line_free(self, frequencies, spectrum, design):
+        '''
+        Select line-free channels. Provided ranges are used directly,
+        otherwise channels whose residual from the baseline exceeds clip
+        times the robust standard deviation are excluded iteratively.
+        '''
+
+        if self.line_free_ranges:
+            mask = np.zeros(len(frequencies), dtype=bool)
+
+            for fmin, fmax in self.line_free_ranges:
+                low, high = sorted((fmin, fmax))
+                mask |= (frequencies > low) & (frequencies < high)
+
+            return mask
+
+        mask = np.isfinite(spectrum)
+        for _ in range(self.iterations):
+            coefficients = np.linalg.lstsq(design[mask], spectrum[mask], rcond=None)[0]
+            residuals = spectrum - design @ coefficients
+
+            # Robust standard deviation from the median absolute deviation
+            sigma = 1.4826 * np.median(np.abs(residuals[mask] - np.median(residuals[mask])))
+            new_mask = np.isfinite(spectrum) & (np.abs(residuals) <= self.clip * sigma)
+
+            # Never clip so far that the fit becomes underdetermined
+            if np.array_equal(new_mask, mask) or np.count_nonzero(new_mask) < design.shape[1]:
+                break
+
+            mask = new_mask
+
+        return mask
+
+    def subtract(self, frequencies, data):
+        '''
+        Fit and subtract the baseline from a spectrum (1D) or from every
+        integration of a cube (rows x channels). All rows share one design
+        matrix and pseudo-inverse, so each chunk of rows is fit with a
+        single matrix product.
+        '''
+
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+        data = np.asarray(data)
+        cube = np.atleast_2d(data)
+
+        design = self._design_matrix(frequencies)
+
+        # The line-free channels of a cube are chosen from its mean spectrum
+        self.line_free_mask = self._find_line_free(frequencies, np.mean(cube, axis=0, dtype=np.float64), design)
+
+        if np.count_nonzero(self.line_free_mask) < design.shape[1]:
+            raise ValueError("Too few line-free channels to fit the baseline")
+
+        pseudo_inverse = np.linalg.pinv(design[self.line_free_mask])
+
+        subtracted = np.empty(cube.shape, dtype=np.result_type(cube.dtype, np.float32))
+        self.coefficients = np.empty((cube.shape[0], design.shape[1]))
+
+        # Fit in float64 one chunk of rows at a time to bound memory
+        for start in range(0, cube.shape[0], self.chunk_size):
+            chunk = np.asarray(cube[start:start + self.chunk_size], dtype=np.float64)
+
+            coefficients = chunk[:, self.line_free_mask] @ pseudo_inverse.T
+            subtracted[start:start + self.chunk_size] = chunk - coefficients @ design.T
+            self.coefficients[start:start + self.chunk_size] = coefficients
+
+        if data.ndim == 1:
+            self.coefficients = self.coefficients[0]
+            return subtracted[0]
+
+        return subtracted
@@ -0,0 +1,165 @@
+import os
+import json
+import pickle
+import hashlib
+
+
+class Cache:
+    def __init__(self, cache_dir: str = None, max_bytes: int = 2 * 1024 ** 3):
+        '''
+        Initialization function for the product cache. Entries are stored
+        as pickles inside the cache directory and are addressed by the hash
+        of the input file, the stage name and the stage parameters.
+        '''
+
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "radio-data-pipeline")
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Remember file hashes so repeated lookups on an unchanged file do not rehash it
+        self._file_hashes = {}
+
+    def file_hash(self, file_path):
+        '''
+        Hash the contents of a file in chunks. The result is memoized
+        on the path, size and modification time of the file.
+        '''
+
+        stat = os.stat(file_path)
+        memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+        if memo_key not in self._file_hashes:
+            digest = hashlib.sha256()
+
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                    digest.update(chunk)
+
+            self._file_hashes[memo_key] = digest.hexdigest()
+
+        return self._file_hashes[memo_key]
+
+    def key(self, file_path, stage, **params):
+        '''
+        Create the cache key for a stage of a given file and parameter set.
+        '''
+
+        description = json.dumps([self.file_hash(file_path), stage, params], sort_keys=True, default=str)
+
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key):
+        '''
+        Return the cached value for a key or None if there is no entry.
+        '''
+
+        path = self._path(key)
+
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+        # Touch the entry so eviction treats it as recently used
+        os.utime(path)
+
+        return value
+
+    def put(self, key, value):
+        '''
+        Store a value under a key and evict old entries if the cache
+        has grown beyond its size bound.
+        '''
+
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+
+        # Write to a temporary file first so readers never see a partial entry
+        with open(temporary_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+
+        self._evict()
+
+    def fetch(self, key, compute):
+        '''
+        Return the cached value for a key, computing and storing it on a miss.
+        '''
+
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+
+        return value
+
+    def get_output(self, key, output_path):
+        '''
+        Return the entry recorded for a stage's output file, or None if 
+        there is none or the file has been changed or removed since.
+        '''
+
+        entry = self.get(key)
+
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            return None
+
+        if entry is None or entry["signature"] != [stat.st_size, stat.st_mtime_ns]:
+            return None
+
+        return entry
+
+    def put_output(self, key, output_path, **fields):
+        '''
+        Record that a stage wrote its output file. Only the file's size and 
+        modification time and any extra fields are stored, not its data.
+        '''
+
+        stat = os.stat(output_path)
+
+        self.put(key, {"signature": [stat.st_size, stat.st_mtime_ns], **fields})
+
+    def _evict(self):
+        '''
+        Remove the least recently used entries until the cache fits
+        within max_bytes.
+        '''
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+
+        # Oldest entries are removed first
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+
+            total -= size
+
+    def clear(self):
+        '''
+        Remove every entry from the cache.
+        '''
+
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and entry.name.endswith(".pkl"):
+                os.remove(entry.path)
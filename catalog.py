@@ -0,0 +1,201 @@
+import os
+import json
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from astropy.io import fits
+import utils
+
+
+# Receiver bands by observing frequency in MHz
+BANDS = [("L", 1000, 2000), ("S", 2000, 4000), ("C", 4000, 8000), ("X", 8000, 12000), ("Ku", 12000, 18000), ("K", 18000, 27000)]
+
+COLUMNS = ("path", "mtime", "size", "object", "date", "obsmode", "datamode", "band", "obsfreq", "obsbw",
+           "start_channel", "stop_channel", "bands", "error")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    object TEXT,
+    date TEXT,
+    obsmode TEXT,
+    datamode TEXT,
+    band TEXT,
+    obsfreq REAL,
+    obsbw REAL,
+    start_channel INTEGER,
+    stop_channel INTEGER,
+    bands TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS observations_object ON observations (object COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS observations_band ON observations (band);
+CREATE INDEX IF NOT EXISTS observations_obsmode ON observations (obsmode);
+CREATE INDEX IF NOT EXISTS observations_date ON observations (date);
+"""
+
+
+def _band(frequency):
+    '''
+    Name the receiver band of an observing frequency in MHz.
+    '''
+
+    if frequency is None:
+        return None
+
+    for name, low, high in BANDS:
+        if low <= frequency < high:
+            return name
+
+    return None
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def _read_entry(path):
+    '''
+    Read the catalog entry of a file from its primary header only.
+    Files that cannot be read are still cataloged with their error
+    so they are not re-read until they change. Returns None if the 
+    file no longer exists.
+    '''
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        # The file was removed after the directory was scanned
+        return None
+
+    entry = dict.fromkeys(COLUMNS)
+    entry.update({"path": path, "mtime": stat.st_mtime, "size": stat.st_size})
+
+    try:
+        header = fits.getheader(path, 0)
+        history = utils.parse_history(header)
+
+        channels = history.get('START,STOP channels')
+        obsfreq = header.get('OBSFREQ')
+
+        entry.update({
+            "object": header.get('OBJECT'),
+            "date": header.get('DATE'),
+            "obsmode": header.get('OBSMODE'),
+            "datamode": history.get('DATAMODE'),
+            "band": _band(obsfreq),
+            "obsfreq": obsfreq,
+            "obsbw": header.get('OBSBW'),
+            "start_channel": int(channels[0]) if isinstance(channels, list) else None,
+            "stop_channel": int(channels[1]) if isinstance(channels, list) else None,
+            "bands": json.dumps(history.get('HIRES bands')),
+        })
+    except Exception as e:
+        entry["error"] = repr(e)
+
+    return entry
+
+
+class Catalog:
+    def __init__(self, db_path: str):
+        '''
+        Initialization function for the observation catalog stored
+        in a SQLite database at the provided path.
+        '''
+
+        self.db_path = db_path
+
+        self.connection = sqlite3.connect(self.db_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _scan(self, directory):
+        '''
+        Find every raw SDFITS file below a directory.
+        '''
+
+        paths = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                stem, extension = os.path.splitext(name)
+                if extension.lower() in utils.FITS_EXTENSIONS and not stem.endswith(utils.PIPELINE_SUFFIXES):
+                    paths.append(os.path.abspath(os.path.join(root, name)))
+
+        return paths
+
+    def update(self, directory: str, workers: int = None):
+        '''
+        Bring the catalog up to date with a directory. Only files that are
+        new or whose modification time changed have their headers read,
+        in parallel. Files that no longer exist are removed.
+        '''
+
+        paths = self._scan(directory)
+        known = dict(self.connection.execute("SELECT path, mtime FROM observations").fetchall())
+
+        changed = [path for path in paths if known.get(path) != _mtime(path)]
+
+        entries = []
+        if changed:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                entries = list(executor.map(_read_entry, changed, chunksize=64))
+
+        # Files removed while the catalog was being updated count as deleted
+        paths = set(paths) - {path for path, entry in zip(changed, entries) if entry is None}
+        entries = [entry for entry in entries if entry is not None]
+
+        # Remove entries of deleted files from the scanned directory
+        root = os.path.join(os.path.abspath(directory), "")
+        removed = [(path,) for path in set(known) - paths if path.startswith(root)]
+
+        # Write every change in a single transaction
+        with self.connection:
+            self.connection.executemany("DELETE FROM observations WHERE path = ?", removed)
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO observations ({', '.join(COLUMNS)}) VALUES ({', '.join(':' + column for column in COLUMNS)})",
+                entries
+            )
+
+        return len(entries), len(removed)
+
+    def query(self, source: str = None, band: str = None, mode: str = None, datamode: str = None, start: str = None, end: str = None):
+        '''
+        Find cataloged observations. Sources match case-insensitively and
+        start and end bound the DATE card as ISO timestamps. Files that
+        could not be read are never returned.
+        '''
+
+        conditions = ["error IS NULL"]
+        parameters = []
+
+        for column, value in (("object", source), ("band", band), ("obsmode", mode), ("datamode", datamode)):
+            if value is not None:
+                conditions.append(f"{column} = ?" + (" COLLATE NOCASE" if column == "object" else ""))
+                parameters.append(value)
+
+        if start is not None:
+            conditions.append("date >= ?")
+            parameters.append(start)
+        if end is not None:
+            conditions.append("date <= ?")
+            parameters.append(end)
+
+        rows = self.connection.execute(
+            f"SELECT * FROM observations WHERE {' AND '.join(conditions)} ORDER BY date",
+            parameters
+        ).fetchall()
+
+        return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    catalog = Catalog("C:/Users/starb/Downloads/catalog.sqlite")
+    catalog.update("C:/Users/starb/Downloads/Raw")
+
+    for observation in catalog.query(source="Cas A", band="L", mode="onoff"):
+        print(observation["path"], observation["date"])
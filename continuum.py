@@ -1,13 +1,11 @@
 import numpy as np
 from astropy.io import fits
 from astropy.table import Table
-from scipy.stats import linregress
-import rcr
 import utils
 
 
 class Continuum:
-    def __init__(self, file_path: str, ifnum, plnum, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges):
+    def __init__(self, file_path: str, ifnum, plnum, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges, cache=None):
         '''
         Initialization function for provided file. Responsible for 
         opening the SDFITS file's header and data and initializing 
@@ -15,10 +13,15 @@ class Continuum:
         '''
 
         self.filepath = file_path
+        self.cache = cache
 
         with fits.open(self.filepath) as hdul:
             self.header = hdul[0].header
             self.data = Table(hdul[1].data)
+            self.data['DATA'] = utils.as_cube(self.data['DATA'])
+
+            # Use the channel prefix-sum index saved alongside the file if there is one
+            self.channel_index = utils.load_channel_index(self.filepath, len(self.data))
         
             # Find total number of feeds and channels
             ifnums = np.unique(self.data['IFNUM'])
@@ -27,10 +30,11 @@ class Continuum:
             # Find total number of channels
             self.channel_count = len(ifnums) * len(plnums)
 
-            self.data = self.data[
-                (self.data['IFNUM'] == ifnum) &
-                (self.data['PLNUM'] == plnum)
-            ]
+            selection = (self.data['IFNUM'] == ifnum) & (self.data['PLNUM'] == plnum)
+            self.data = self.data[selection]
+
+            if self.channel_index is not None:
+                self.channel_index = self.channel_index[np.asarray(selection)]
 
             self.ifnum = ifnum
             self.plnum = plnum
@@ -43,22 +47,32 @@ class Continuum:
             self.including_time_ranges = including_time_ranges
             self.excluding_time_ranges = excluding_time_ranges
 
-    def _parse_calibration_spike(self, data):
+    def _cached(self, stage, compute, **params):
         '''
-        Find on and off diode sections.
+        Look up a stage result in the product cache, computing it on a miss. 
+        Entries are keyed on the file contents, the rows selected by feed, 
+        polarization and time, and any further parameters the stage depends on.
         '''
 
-        on_mask = data[
-            (data['CALSTATE'] == 1) &
-            (data['SWPVALID'] == 0) 
-        ]
+        if self.cache is None:
+            return compute()
 
-        off_mask = data[
-            (data['CALSTATE'] == 0) &
-            (data['SWPVALID'] == 0) 
-        ]
+        key = self.cache.key(
+            self.filepath, stage,
+            ifnum=self.ifnum, plnum=self.plnum,
+            including_time_ranges=self.including_time_ranges,
+            excluding_time_ranges=self.excluding_time_ranges,
+            **params
+        )
 
-        return on_mask, off_mask
+        return self.cache.fetch(key, compute)
+
+    def _parse_calibration_spike(self, data):
+        '''
+        Find on and off diode sections.
+        '''
+
+        return utils.parse_calibration_spike(data)
 
     def linear(self, x, params): # model function
         return params[0] + x * params[1]
@@ -74,6 +88,10 @@ class Continuum:
         Perform Robust Chauvenet Rejection (RCR) on the provided array.
         '''
 
+        # scipy and rcr are only needed for the diode fits, so they are loaded on first use
+        from scipy.stats import linregress
+        import rcr
+
         x = array[0].copy()
         x -= np.average(x)
 
@@ -145,15 +163,28 @@ class Continuum:
 
         # Filter times and frequencies
         if self.including_time_ranges or self.excluding_time_ranges:
-            self.data = utils.filter_time_ranges(self.header, self.data, self.including_time_ranges, self.excluding_time_ranges)
-        if self.including_frequency_ranges or self.excluding_frequency_ranges:
+            time_mask = utils.time_range_mask(self.header, self.data, self.including_time_ranges, self.excluding_time_ranges)
+            self.data = self.data[time_mask]
+
+            if self.channel_index is not None:
+                self.channel_index = self.channel_index[time_mask]
+
+        if self.channel_index is not None:
+            # Band sums come straight from the prefix-sum index, so the cube is 
+            # replaced by a single channel holding each row's sum
+            frequencies, sums = utils.sum_frequency_ranges(self.header, self.channel_index, self.ifnum, self.including_frequency_ranges, self.excluding_frequency_ranges)
+            self.data['DATA'] = sums[:, np.newaxis]
+        elif self.including_frequency_ranges or self.excluding_frequency_ranges:
             frequencies, self.data['DATA'] = utils.filter_frequency_ranges(self.header, self.data, self.ifnum, self.including_frequency_ranges, self.excluding_frequency_ranges)
         else:
             frequencies = utils.get_frequency_range(self.header, self.ifnum)
             frequencies = np.linspace(frequencies[1], frequencies[0], frequencies[2])
 
         # Identify calibration spikes
-        data_start_index, post_cal_start_index, off_start_index = utils.find_calibrations(self.header, self.data, self.channel_count)
+        data_start_index, post_cal_start_index, off_start_index = self._cached(
+            "continuum_segments",
+            lambda: utils.find_calibrations(self.header, self.data, self.channel_count)
+        )
         self.data_start_index = data_start_index
         self.post_cal_start_index = post_cal_start_index
         self.off_start_index = off_start_index
@@ -164,15 +195,44 @@ class Continuum:
         pre_calibration_intensity = None
         post_calibration_intensity = None
 
+        # The diode fits and row sums depend on the channels being summed, 
+        # while the calibration segments only depend on the rows
+        channels = {
+            "including_frequency_ranges": self.including_frequency_ranges,
+            "excluding_frequency_ranges": self.excluding_frequency_ranges,
+            "precision": utils.PRECISION,
+        }
+
         # Calculate calibration heights
-        pre_calibration_intensity, pre_calibration_uncertainty = self._calculate_calibration_height(pre_calibration)
-        post_calibration_intensity, post_calibration_uncertainty = self._calculate_calibration_height(post_calibration)
+        pre_calibration_intensity, pre_calibration_uncertainty = self._cached(
+            "diode_pre",
+            lambda: self._calculate_calibration_height(pre_calibration),
+            **channels
+        )
+        post_calibration_intensity, post_calibration_uncertainty = self._cached(
+            "diode_post",
+            lambda: self._calculate_calibration_height(post_calibration),
+            **channels
+        )
 
-        continuum = utils.integrate_data(self.header, self.data[self.data_start_index:self.post_cal_start_index], "continuum")
+        # Keep the calibration results so they can be stored with the continuum
+        self.pre_calibration_intensity = pre_calibration_intensity
+        self.pre_calibration_uncertainty = pre_calibration_uncertainty
+        self.post_calibration_intensity = post_calibration_intensity
+        self.post_calibration_uncertainty = post_calibration_uncertainty
+        self.z_score = None
+
+        # Per-row channel sums of the observation section
+        continuum = self._cached(
+            "continuum_row_sums",
+            lambda: utils.integrate_data(self.header, self.data[self.data_start_index:self.post_cal_start_index], "continuum"),
+            **channels
+        )
         
         # Perform gain calibration with calibration spikes
         if pre_calibration_intensity and post_calibration_intensity:
             z_score = abs(pre_calibration_intensity - post_calibration_intensity) / np.sqrt(pre_calibration_uncertainty ** 2 + post_calibration_uncertainty ** 2)
+            self.z_score = z_score
 
             if z_score >= 1.96:
                 for ind, i in enumerate(continuum[1]):
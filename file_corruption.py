@@ -1,22 +1,77 @@
 import os
+from time import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from astropy.io import fits
 from astropy.table import Table
+from validate import Validation, prevalidate
+
+
+# Kinds of corruption and the stage expected to reject each of them. NaN values
+# are masked by Validation rather than rejected, so those variants should pass.
+EXPECTED_OUTCOMES = {
+    "end": "prevalidation",
+    "truncated": "prevalidation",
+    "dtype": "prevalidation",
+    "history": "prevalidation",
+    "date_obs": "validation",
+    "nan": "accepted",
+}
+
 
 class Corrupt:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, seed=None):
         self.filepath = file_path
         self.missing_values = []
+        self.rng = np.random.default_rng(seed)
+
+        # Corruptions applied to the written file rather than the header or table
+        self.remove_end = False
+        self.truncate = False
 
         with fits.open(self.filepath) as hdul:
             self.header = hdul[0].header.copy()
-            print(repr(self.header))
             self.data = Table(hdul[1].data)
 
-    def corrupt(self):
-        if 'END' in self.header:
-            del self.header['END']
+    def corrupt(self, kind="end"):
+        '''
+        Apply one kind of corruption to the file.
+        '''
+
+        if kind == "end":
+            # astropy always writes an END card, so it is blanked in the saved file
+            self.remove_end = True
             self.missing_values.append('END')
 
+        elif kind == "truncated":
+            self.truncate = True
+
+        elif kind == "dtype":
+            self.data['DATA'] = np.asarray(self.data['DATA']).astype(np.int16)
+
+        elif kind == "nan":
+            # Replace roughly one percent of the data cube with NaN values
+            cube = np.array(self.data['DATA'])
+            cube[self.rng.random(cube.shape) < 0.01] = np.nan
+            self.data['DATA'] = cube
+
+        elif kind == "date_obs":
+            # Replace the digits of a few timestamps with letters
+            dates = np.array(self.data['DATE-OBS'])
+            rows = self.rng.choice(len(dates), size=max(1, len(dates) // 100), replace=False)
+            garble = str.maketrans("0123456789", "OIZEASGTBQ")
+            for row in rows:
+                dates[row] = dates[row].translate(garble)
+            self.data['DATE-OBS'] = dates
+
+        elif kind == "history":
+            if 'HISTORY' in self.header:
+                del self.header['HISTORY']
+                self.missing_values.append('HISTORY')
+
+        else:
+            raise ValueError(f"Unknown corruption: {kind}")
+
     def save(self, output_path=None):
         if output_path is None:
             base, ext = os.path.splitext(self.filepath)
@@ -24,17 +79,105 @@ class Corrupt:
 
         primary_hdu = fits.PrimaryHDU(header=self.header)
 
-        if 'END' in primary_hdu.header and 'END' in self.missing_values:
-            del primary_hdu.header['END']
-            # pass
-
         table_hdu = fits.BinTableHDU(data=self.data)
         hdulist = fits.HDUList([primary_hdu, table_hdu])
 
         hdulist.writeto(output_path, overwrite=True, output_verify='ignore')
 
+        if self.remove_end or self.truncate:
+            with fits.open(output_path) as hdul:
+                header_end = hdul.fileinfo(0)['datLoc']
+                data_location = hdul.fileinfo(1)['datLoc']
+                data_size = hdul[1].header['NAXIS1'] * hdul[1].header['NAXIS2']
+
+            if self.remove_end:
+                # Blank the END card of the primary header
+                with open(output_path, "r+b") as f:
+                    header_bytes = f.read(header_end)
+                    for card_start in range(0, header_end, 80):
+                        if header_bytes[card_start:card_start + 80] == b"END".ljust(80):
+                            f.seek(card_start)
+                            f.write(b" " * 80)
+                            break
+
+            if self.truncate:
+                # Cut the file off halfway through the data
+                os.truncate(output_path, data_location + data_size // 2)
+
+        return output_path
+
+
+def _make_variant(arguments):
+    '''
+    Write one corrupted variant of a file.
+    '''
+
+    file_path, output_dir, kind, seed = arguments
+
+    base, ext = os.path.splitext(os.path.basename(file_path))
+
+    c = Corrupt(file_path, seed=seed)
+    c.corrupt(kind)
+
+    return kind, c.save(os.path.join(output_dir, f"{base}_{kind}_{seed}_corrupted{ext}"))
+
+def _check_variant(arguments):
+    '''
+    Run a variant through pre-validation and validation and
+    record which stage rejected it and how long that took.
+    '''
+
+    kind, file_path = arguments
+
+    outcome = "accepted"
+    reason = None
+    start_time = time()
+
+    try:
+        prevalidate(file_path)
+    except Exception as e:
+        outcome, reason = "prevalidation", str(e)
+    else:
+        try:
+            Validation(file_path).validate()
+        except Exception as e:
+            outcome, reason = "validation", str(e)
+
+    return {
+        "kind": kind,
+        "file": file_path,
+        "outcome": outcome,
+        "expected": EXPECTED_OUTCOMES[kind],
+        "passed": outcome == EXPECTED_OUTCOMES[kind],
+        "reason": reason,
+        "seconds": round(time() - start_time, 3),
+    }
+
+def fuzz(file_path: str, output_dir: str, kinds=None, copies: int = 1, workers: int = None):
+    '''
+    Generate corrupted variants of a file in parallel and check that
+    each is rejected by the expected stage. Returns one report per variant.
+    '''
+
+    if kinds is None:
+        kinds = list(EXPECTED_OUTCOMES)
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = [(file_path, output_dir, kind, seed) for kind in kinds for seed in range(copies)]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        variants = list(executor.map(_make_variant, jobs))
+        reports = list(executor.map(_check_variant, variants))
+
+    return reports
+
+
 if __name__ == "__main__":
     filepath = "C:/Users/starb/Downloads/0136873(1).fits"
     c = Corrupt(filepath)
     c.corrupt()
-    c.save()
\ No newline at end of file
+    c.save()
+
+    for report in fuzz(filepath, "C:/Users/starb/Downloads/Corrupted", copies=4):
+        print(report["kind"], report["outcome"], report["seconds"], report["reason"])
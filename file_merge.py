@@ -21,7 +21,7 @@ class Merge:
 
         for path in self.file_paths:
             with fits.open(path) as hdul:
-                hdul.verify("exception")
+                utils.verify(hdul)
                 self.headers.append(hdul[0].header)
                 self.tables.append(Table(hdul[1].data))
 
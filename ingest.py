@@ -0,0 +1,330 @@
+import os
+import json
+import asyncio
+from time import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import utils
+
+
+# Failures that may pass on a later attempt. Anything else, such as a file 
+# rejected by validation, fails the same way every time and is not retried.
+TRANSIENT_ERRORS = (OSError, BrokenProcessPool)
+
+
+def run_pipeline(file_path: str, atmosphere_correction: bool = True, store_path: str = None):
+    '''
+    Run the Validation, Atmosphere Correction, Continuum and Spectrum
+    stages on a file for every IFNUM/PLNUM pair it contains. The
+    continua, spectra and their quick-look pyramids are saved alongside 
+    the file as an .npz. If store_path is provided the continua and 
+    spectra are also written to that products store in one transaction 
+    (use functools.partial to pass it through the ingest service).
+    '''
+
+    # Stages are imported here so the service itself starts without the heavy dependencies
+    import numpy as np
+    from astropy.io import fits
+    from validate import Validation
+    from atmosphere_correction import Atmosphere_Correction
+    from continuum import Continuum
+    from spectrum import Spectrum
+    from quicklook import Quicklook
+    from products import Products, continuum_record, spectrum_record
+
+    root, extension = os.path.splitext(file_path)
+
+    Validation(file_path).validate(channel_index=True)
+    reduced_path = root + "_validated" + extension
+
+    if atmosphere_correction:
+        Atmosphere_Correction(reduced_path).atmosphere_correction(channel_index=True)
+        reduced_path = root + "_validated_corrected" + extension
+
+    # Find every feed and polarization in the reduced file
+    with fits.open(reduced_path) as hdul:
+        pairs = sorted(set(zip(hdul[1].data['IFNUM'].tolist(), hdul[1].data['PLNUM'].tolist())))
+
+    products = {}
+    records = []
+    for ifnum, plnum in pairs:
+        c = Continuum(reduced_path, ifnum, plnum, None, None, None, None)
+        continuum = c.continuum()
+        s = Spectrum(reduced_path, ifnum, plnum, None, None, None, None)
+        spectrum = s.spectrum()
+
+        records.extend([continuum_record(c, continuum), spectrum_record(s, spectrum)])
+
+        products[f"continuum_{ifnum}_{plnum}_time"] = continuum[0]
+        products[f"continuum_{ifnum}_{plnum}_intensity"] = continuum[1]
+        products[f"spectrum_{ifnum}_{plnum}_frequency"] = spectrum[0]
+        products[f"spectrum_{ifnum}_{plnum}_intensity"] = spectrum[1]
+
+        # Reduced previews for viewers that only need a screen's worth of samples
+        products.update(Quicklook(continuum[0], continuum[1]).to_arrays(f"continuum_{ifnum}_{plnum}_"))
+        products.update(Quicklook(spectrum[0], spectrum[1]).to_arrays(f"spectrum_{ifnum}_{plnum}_"))
+
+    products_path = root + "_products.npz"
+    np.savez(products_path, **products)
+
+    if store_path is not None:
+        store = Products(store_path)
+        try:
+            store.insert(records)
+        finally:
+            store.close()
+
+    return {"reduced": reduced_path, "products": products_path}
+
+
+class Ingest:
+    def __init__(self, watch_dir: str, status_dir: str = None, workers: int = 2, queue_size: int = 8,
+                 settle_time: float = 2.0, poll_interval: float = 1.0, retries: int = 2, retry_delay: float = 5.0,
+                 process=run_pipeline, executor=None):
+        '''
+        Initialization function for the ingest service. Responsible for
+        the watched directory, the bounded queue of arrivals and the
+        executor the pipeline stages run in.
+        '''
+
+        self.watch_dir = watch_dir
+        self.status_dir = status_dir if status_dir is not None else os.path.join(watch_dir, "status")
+
+        os.makedirs(self.status_dir, exist_ok=True)
+
+        self.workers = workers
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+        # The pipeline callable must be picklable when the default process pool is used
+        self.process = process
+        self.executor = executor
+        self._own_executor = False
+
+        # A full queue blocks the watcher, which holds off new arrivals until workers catch up
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+        # Size and modification time of files that have not yet settled
+        self._pending = {}
+        # Files that are queued or running
+        self._active = set()
+
+        self._stopping = asyncio.Event()
+
+    def _status_path(self, file_path):
+        return os.path.join(self.status_dir, os.path.basename(file_path) + ".json")
+
+    def _read_status(self, file_path):
+        '''
+        Read the status record of a file or return None if it has none.
+        '''
+
+        try:
+            with open(self._status_path(file_path)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_status(self, file_path, state, **fields):
+        '''
+        Write the status record of a file. Records are replaced atomically
+        so readers never see a partial record. Failed writes are reported 
+        and otherwise ignored.
+        '''
+
+        try:
+            stat = os.stat(file_path)
+            size, mtime = stat.st_size, stat.st_mtime
+        except OSError:
+            # The file was removed after it arrived
+            size, mtime = None, None
+
+        record = {
+            "file": os.path.abspath(file_path),
+            "state": state,
+            "size": size,
+            "mtime": mtime,
+            "updated": time(),
+        }
+        record.update(fields)
+
+        path = self._status_path(file_path)
+        try:
+            with open(path + ".tmp", "w") as f:
+                json.dump(record, f, indent=2, default=str)
+            os.replace(path + ".tmp", path)
+        except OSError as e:
+            # A lost record must not stop the watcher or a worker. The file is 
+            # picked up again on a later scan if its final record was lost.
+            print(f"Could not write the status of {file_path}: {e}")
+
+    def _is_candidate(self, entry):
+        '''
+        Only raw SDFITS files are ingested, never the pipeline's own outputs.
+        '''
+
+        stem, extension = os.path.splitext(entry.name)
+
+        return (
+            entry.is_file()
+            and extension.lower() in utils.FITS_EXTENSIONS
+            and not stem.endswith(utils.PIPELINE_SUFFIXES)
+        )
+
+    def _is_processed(self, path, stat):
+        '''
+        A file is processed when its status record is final and it has
+        not changed since.
+        '''
+
+        status = self._read_status(path)
+
+        return (
+            status is not None
+            and status["state"] in ("done", "failed")
+            and status["size"] == stat.st_size
+            and status["mtime"] == stat.st_mtime
+        )
+
+    def _scan(self):
+        '''
+        Find arrivals that have stopped changing for at least settle_time.
+        Files still being written keep resetting their settle clock.
+        '''
+
+        now = time()
+        settled = []
+
+        for entry in os.scandir(self.watch_dir):
+            try:
+                if not self._is_candidate(entry) or entry.path in self._active:
+                    continue
+
+                stat = entry.stat()
+            except OSError:
+                # The file was removed or renamed since the directory was listed
+                self._pending.pop(entry.path, None)
+                continue
+
+            signature = (stat.st_size, stat.st_mtime)
+
+            if self._is_processed(entry.path, stat):
+                continue
+
+            previous = self._pending.get(entry.path)
+            if previous is None or previous[0] != signature:
+                self._pending[entry.path] = (signature, now)
+            elif now - previous[1] >= self.settle_time:
+                settled.append(entry.path)
+
+        return settled
+
+    async def _watch(self):
+        '''
+        Poll the watched directory and queue settled arrivals until stopped.
+        '''
+
+        while not self._stopping.is_set():
+            for path in self._scan():
+                del self._pending[path]
+                self._active.add(path)
+                self._write_status(path, "queued")
+
+                # Waits here while the queue is full
+                await self.queue.put(path)
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _replace_executor(self, executor):
+        '''
+        A process pool cannot run anything after one of its workers died, so 
+        a pool created by the service is replaced. Only the first worker to 
+        notice the broken pool replaces it.
+        '''
+
+        if self._own_executor and self.executor is executor:
+            executor.shutdown(wait=False)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    async def _work(self):
+        '''
+        Run the pipeline on queued files in the executor, retrying transient
+        failures with exponential backoff. Other failures are final at once.
+        '''
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            path = await self.queue.get()
+
+            try:
+                for attempt in range(1, self.retries + 2):
+                    self._write_status(path, "running", attempts=attempt)
+                    start_time = time()
+                    executor = self.executor
+
+                    try:
+                        result = await loop.run_in_executor(executor, self.process, path)
+                    except TRANSIENT_ERRORS as e:
+                        if attempt > self.retries:
+                            self._write_status(path, "failed", attempts=attempt, error=repr(e))
+                            break
+
+                        if isinstance(e, BrokenProcessPool):
+                            self._replace_executor(executor)
+
+                        await asyncio.sleep(self.retry_delay * 2 ** (attempt - 1))
+                    except Exception as e:
+                        self._write_status(path, "failed", attempts=attempt, error=repr(e))
+                        break
+                    else:
+                        self._write_status(path, "done", attempts=attempt, result=result, seconds=round(time() - start_time, 3))
+                        break
+            finally:
+                self._active.discard(path)
+                self.queue.task_done()
+
+    def stop(self):
+        '''
+        Stop watching for arrivals. Files already queued are still processed.
+        '''
+
+        self._stopping.set()
+
+    async def run(self):
+        '''
+        Watch the directory and process arrivals until stop is called.
+        '''
+
+        self._own_executor = self.executor is None
+        if self._own_executor:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+        try:
+            await self._watch()
+
+            # Let the workers finish everything that was already queued
+            await self.queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+            if self._own_executor:
+                self.executor.shutdown()
+                self.executor = None
+                self._own_executor = False
+
+
+if __name__ == "__main__":
+    watch_dir = "C:/Users/starb/Downloads/Incoming"
+
+    ingest = Ingest(watch_dir)
+    asyncio.run(ingest.run())
@@ -1,13 +1,57 @@
 import os
 from time import time
 
+import numpy as np
+
 import utils
+from cache import Cache
 from validate import Validation
 from atmosphere_correction import Atmosphere_Correction
 from continuum import Continuum
 from spectrum import Spectrum
+from quicklook import Quicklook
+
+
+def _plot_series(axis, series, quicklook, width):
+    '''
+    Draw a series at full resolution if it fits the plot width, otherwise 
+    the min/max envelope and mean of the quick-look level that does.
+    '''
+
+    x, y = series
+
+    if len(x) <= width:
+        axis.plot(x, y, color="black")
+    else:
+        level = quicklook.level(width)
+        axis.fill_between(level["x"], level["min"], level["max"], color="lightgray")
+        axis.plot(level["x"], level["mean"], color="black")
+
+    axis.set_xlim(min(x), max(x))
+
+def plot(continuum, spectrum, continuum_quicklook, spectrum_quicklook, width=2000):
+    '''
+    Plot the continuum and spectrum, falling back to the quick-look level 
+    that matches the plot width for series too long to draw in full. 
+    matplotlib is imported here so headless runs never load it.
+    '''
+
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(8, 6))
+
+    _plot_series(axes[0], continuum, continuum_quicklook, width)
+    axes[0].set_xlabel("Time (s)")
+    axes[0].set_ylabel("Intensity")
+    axes[0].set_title("Continuum")
+
+    _plot_series(axes[1], spectrum, spectrum_quicklook, width)
+    axes[1].set_xlabel("Frequency (MHz)")
+    axes[1].set_ylabel("Intensity")
+    axes[1].set_title("Spectrum")
 
-import matplotlib.pyplot as plt
+    plt.tight_layout()
+    plt.show()
 
 
 if __name__ == "__main__":
@@ -17,48 +61,53 @@ if __name__ == "__main__":
     including_time_ranges = None
     excluding_time_ranges = None
 
+    # Store the data cube in single precision while sums and fits stay in double precision
+    utils.set_precision("float32")
+
+    # Intermediate products are reused across re-runs of the same file
+    cache = Cache()
+
     start_time = time()
 
     filepath = "C:/Users/starb/Downloads/Raw/0144717daisy_merge.fits"
     root, extension = os.path.splitext(filepath)
 
-    v = Validation(filepath)
-    v.validate()
+    v = Validation(filepath, cache=cache)
+    v.validate(channel_index=True)
 
     time0 = time()
     print("Validation time:", round((time0 - start_time),3), " seconds")
 
-    # ac = Atmosphere_Correction(root + "_validated" + extension)
+    # ac = Atmosphere_Correction(root + "_validated" + extension, cache=cache)
     # ac.atmosphere_correction()
 
     time1 = time()
     print("Atmosphere correction time:", round((time1 - time0),3), " seconds")
 
-    c = Continuum(root + "_validated" + extension, 0, 1, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges)
+    c = Continuum(root + "_validated" + extension, 0, 1, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges, cache=cache)
     continuum = c.continuum()
 
     time2 = time()
     print("Continuum creation time:", round((time2 - time1),3), " seconds")
 
-    s = Spectrum(root + "_validated" + extension, 0, 1, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges)
+    s = Spectrum(root + "_validated" + extension, 0, 1, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges, cache=cache)
     spectrum = s.spectrum()
 
     time3 = time()
     print("Spectrum creation time:", round((time3 - time2),3), " seconds")
 
-    fig, axes = plt.subplots(nrows=2, ncols=1, figsize=(8, 6))
-
-    axes[0].plot(continuum[0], continuum[1], color="black")
-    axes[0].set_xlim(min(continuum[0]), max(continuum[0]))
-    axes[0].set_xlabel("Time (s)")
-    axes[0].set_ylabel("Intensity")
-    axes[0].set_title("Continuum")
-
-    axes[1].plot(spectrum[0], spectrum[1], color="black")
-    axes[1].set_xlim(min(spectrum[0]), max(spectrum[0]))
-    axes[1].set_xlabel("Frequency (MHz)")
-    axes[1].set_ylabel("Intensity")
-    axes[1].set_title("Spectrum")
-
-    plt.tight_layout()
-    plt.show()
+    # Build and store reduced previews of both products
+    continuum_quicklook = Quicklook(continuum[0], continuum[1])
+    spectrum_quicklook = Quicklook(spectrum[0], spectrum[1])
+    np.savez(
+        root + "_quicklook.npz",
+        **continuum_quicklook.to_arrays("continuum_"),
+        **spectrum_quicklook.to_arrays("spectrum_")
+    )
+
+    time4 = time()
+    print("Quick-look creation time:", round((time4 - time3),3), " seconds")
+
+    # Headless runs (PIPELINE_HEADLESS=1) skip plotting entirely
+    if os.environ.get("PIPELINE_HEADLESS") != "1":
+        plot(continuum, spectrum, continuum_quicklook, spectrum_quicklook)
@@ -0,0 +1,255 @@
+import os
+import json
+import sqlite3
+import numpy as np
+from astropy.time import Time
+import utils
+
+
+COLUMNS = ("path", "observation", "source", "kind", "ifnum", "plnum", "time_start", "time_end",
+           "pre_calibration", "pre_calibration_uncertainty", "post_calibration", "post_calibration_uncertainty",
+           "z_score", "data_start_index", "post_cal_start_index", "off_start_index", "metadata", "length", "x", "y")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    observation TEXT NOT NULL,
+    source TEXT,
+    kind TEXT NOT NULL,
+    ifnum INTEGER NOT NULL,
+    plnum INTEGER NOT NULL,
+    time_start REAL,
+    time_end REAL,
+    pre_calibration REAL,
+    pre_calibration_uncertainty REAL,
+    post_calibration REAL,
+    post_calibration_uncertainty REAL,
+    z_score REAL,
+    data_start_index INTEGER,
+    post_cal_start_index INTEGER,
+    off_start_index INTEGER,
+    metadata TEXT,
+    length INTEGER NOT NULL,
+    x BLOB NOT NULL,
+    y BLOB NOT NULL,
+    UNIQUE (path, kind, ifnum, plnum)
+);
+CREATE INDEX IF NOT EXISTS products_observation ON products (observation);
+CREATE INDEX IF NOT EXISTS products_source ON products (source COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS products_time ON products (time_start, time_end);
+"""
+
+
+def _raw_path(file_path):
+    '''
+    Identify an observation by the absolute path of its raw file, found by 
+    removing the suffixes of the reduction stages from the reduced file.
+    '''
+
+    root, extension = os.path.splitext(os.path.abspath(file_path))
+
+    while root.endswith(utils.STAGE_SUFFIXES):
+        root = root[:root.rindex("_")]
+
+    return root + extension
+
+def _observation(file_path):
+    '''
+    Name an observation after its raw file.
+    '''
+
+    return os.path.splitext(os.path.basename(_raw_path(file_path)))[0]
+
+def _optional(value, kind):
+    return None if value is None else kind(value)
+
+def _mjd(value):
+    '''
+    Accept times as MJD numbers or ISO timestamps.
+    '''
+
+    return Time(value, format="isot").mjd if isinstance(value, str) else float(value)
+
+def continuum_record(c, continuum):
+    '''
+    Build a record from a Continuum and the result of its continuum().
+    '''
+
+    t0 = Time(c.header["DATE"], format="isot").mjd
+
+    return {
+        "path": _raw_path(c.filepath),
+        "observation": _observation(c.filepath),
+        "source": c.header.get("OBJECT"),
+        "kind": "continuum",
+        "ifnum": int(c.ifnum),
+        "plnum": int(c.plnum),
+        "time_start": t0 + np.min(continuum[0]) / 86400 if len(continuum[0]) else None,
+        "time_end": t0 + np.max(continuum[0]) / 86400 if len(continuum[0]) else None,
+        "pre_calibration": _optional(c.pre_calibration_intensity, float),
+        "pre_calibration_uncertainty": _optional(c.pre_calibration_uncertainty, float),
+        "post_calibration": _optional(c.post_calibration_intensity, float),
+        "post_calibration_uncertainty": _optional(c.post_calibration_uncertainty, float),
+        "z_score": _optional(c.z_score, float),
+        "data_start_index": _optional(c.data_start_index, int),
+        "post_cal_start_index": _optional(c.post_cal_start_index, int),
+        "off_start_index": _optional(c.off_start_index, int),
+        "metadata": json.dumps({
+            "including_frequency_ranges": c.including_frequency_ranges,
+            "excluding_frequency_ranges": c.excluding_frequency_ranges,
+            "including_time_ranges": c.including_time_ranges,
+            "excluding_time_ranges": c.excluding_time_ranges,
+        }),
+        "x": continuum[0],
+        "y": continuum[1],
+    }
+
+def spectrum_record(s, spectrum):
+    '''
+    Build a record from a Spectrum and the result of its spectrum().
+    '''
+
+    t0 = Time(s.header["DATE"], format="isot").mjd
+    times = utils.relative_times(s.header, s.data) if len(s.data) else []
+
+    return {
+        "path": _raw_path(s.filepath),
+        "observation": _observation(s.filepath),
+        "source": s.header.get("OBJECT"),
+        "kind": "spectrum",
+        "ifnum": int(s.ifnum),
+        "plnum": int(s.plnum),
+        "time_start": t0 + np.min(times) / 86400 if len(times) else None,
+        "time_end": t0 + np.max(times) / 86400 if len(times) else None,
+        "pre_calibration": None,
+        "pre_calibration_uncertainty": None,
+        "post_calibration": None,
+        "post_calibration_uncertainty": None,
+        "z_score": None,
+        "data_start_index": None,
+        "post_cal_start_index": None,
+        "off_start_index": _optional(s.off_start_index, int),
+        "metadata": json.dumps({
+            "including_frequency_ranges": s.including_frequency_ranges,
+            "excluding_frequency_ranges": s.excluding_frequency_ranges,
+            "including_time_ranges": s.including_time_ranges,
+            "excluding_time_ranges": s.excluding_time_ranges,
+            "baseline": repr(s.baseline) if s.baseline is not None else None,
+            "bandpass": s.bandpass,
+        }),
+        "x": spectrum[0],
+        "y": spectrum[1],
+    }
+
+
+class Products:
+    def __init__(self, db_path: str, timeout: float = 60.0):
+        '''
+        Initialization function for the reduced products store. Arrays are
+        stored as contiguous little-endian float64 blobs next to their
+        calibration metadata in a SQLite database at the provided path.
+        '''
+
+        self.db_path = db_path
+
+        # Every process opens its own connection. WAL lets readers continue while
+        # one worker writes, and the timeout makes other writers wait their turn.
+        self.connection = sqlite3.connect(self.db_path, timeout=timeout)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def insert(self, records):
+        '''
+        Write many records in a single transaction. A record replaces any
+        earlier product of the same raw file, kind, IFNUM and PLNUM. Raw 
+        files with the same name in different directories are kept apart.
+        '''
+
+        rows = []
+        for record in records:
+            x = np.ascontiguousarray(record["x"], dtype="<f8")
+            y = np.ascontiguousarray(record["y"], dtype="<f8")
+
+            if len(x) != len(y):
+                raise ValueError(f"Product arrays differ in length for {record['observation']}")
+
+            rows.append({**record, "length": len(x), "x": x.tobytes(), "y": y.tobytes()})
+
+        with self.connection:
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO products ({', '.join(COLUMNS)}) VALUES ({', '.join(':' + column for column in COLUMNS)})",
+                rows
+            )
+
+    def query(self, observation: str = None, source: str = None, kind: str = None, ifnum: int = None, plnum: int = None,
+              start=None, end=None, path: str = None, arrays: bool = True):
+        '''
+        Find stored products. start and end (MJD or ISO timestamps) select
+        products overlapping that time range. Observations are named after
+        their raw files, so files with the same name in different directories
+        share a name and are told apart by path. Arrays are decoded without
+        copying unless arrays is False, in which case they are left out.
+        '''
+
+        conditions = []
+        parameters = []
+
+        if path is not None:
+            path = os.path.abspath(path)
+
+        for column, value in (("path", path), ("observation", observation), ("kind", kind), ("ifnum", ifnum), ("plnum", plnum)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+
+        if source is not None:
+            conditions.append("source = ? COLLATE NOCASE")
+            parameters.append(source)
+        if start is not None:
+            conditions.append("time_end >= ?")
+            parameters.append(_mjd(start))
+        if end is not None:
+            conditions.append("time_start <= ?")
+            parameters.append(_mjd(end))
+
+        columns = "*" if arrays else ", ".join(["id"] + [column for column in COLUMNS if column not in ("x", "y")])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        rows = self.connection.execute(f"SELECT {columns} FROM products {where} ORDER BY time_start", parameters).fetchall()
+
+        results = []
+        for row in rows:
+            result = dict(row)
+            result["metadata"] = json.loads(result["metadata"]) if result["metadata"] else None
+
+            if arrays:
+                result["x"] = np.frombuffer(result["x"], dtype="<f8")
+                result["y"] = np.frombuffer(result["y"], dtype="<f8")
+
+            results.append(result)
+
+        return results
+
+
+if __name__ == "__main__":
+    from continuum import Continuum
+    from spectrum import Spectrum
+
+    filepath = "C:/Users/starb/Downloads/0144767_validated_corrected.fits"
+
+    c = Continuum(filepath, 0, 0, None, None, None, None)
+    continuum = c.continuum()
+
+    s = Spectrum(filepath, 0, 0, None, None, None, None)
+    spectrum = s.spectrum()
+
+    store = Products("C:/Users/starb/Downloads/products.sqlite")
+    store.insert([continuum_record(c, continuum), spectrum_record(s, spectrum)])
+
+    for product in store.query(source="Cas A", kind="continuum"):
+        print(product["observation"], product["length"], product["z_score"])
@@ -0,0 +1,108 @@
+import numpy as np
+
+
+FIELDS = ("x", "min", "max", "mean", "count")
+
+
+class Quicklook:
+    def __init__(self, x, y, min_bins: int = 64):
+        '''
+        Initialization function for a continuum or spectrum. Builds a
+        decimation pyramid where level k holds the min, max and mean of
+        bins of 2**(k + 1) samples, down to roughly min_bins bins.
+        '''
+
+        self.length = len(y)
+        self.levels = self._build(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), min_bins)
+
+    def _build(self, x, y, min_bins):
+        '''
+        Reduce the full-resolution series once into bins of two samples,
+        then build every coarser level from the level below it.
+        '''
+
+        # Only the first level touches the full-resolution series. NaN samples
+        # are ignored by the min and max and left out of the mean.
+        finite = np.isfinite(y)
+        level = {
+            "x": x,
+            "min": y,
+            "max": y,
+            "sum": np.where(finite, y, 0.0),
+            "count": finite.astype(np.int64),
+        }
+
+        # x is averaged over every sample while y only over finite samples
+        x_sum = x
+        x_count = np.ones(len(x), dtype=np.int64)
+
+        levels = []
+        while not levels or len(level["min"]) > min_bins:
+            starts = np.arange(0, len(level["min"]), 2)
+
+            x_sum = np.add.reduceat(x_sum, starts)
+            x_count = np.add.reduceat(x_count, starts)
+
+            level = {
+                "min": np.fmin.reduceat(level["min"], starts),
+                "max": np.fmax.reduceat(level["max"], starts),
+                "sum": np.add.reduceat(level["sum"], starts),
+                "count": np.add.reduceat(level["count"], starts),
+            }
+            level["x"] = x_sum / x_count
+
+            levels.append(level)
+
+        for level in levels:
+            level["mean"] = np.divide(level["sum"], level["count"], out=np.full(len(level["sum"]), np.nan), where=level["count"] > 0)
+            del level["sum"]
+
+        return levels
+
+    def level(self, width: int):
+        '''
+        Return the finest level with no more bins than the provided
+        width (e.g. the plot width in pixels).
+        '''
+
+        for level in self.levels:
+            if len(level["x"]) <= width:
+                return level
+
+        return self.levels[-1]
+
+    def to_arrays(self, prefix: str = ""):
+        '''
+        Flatten the pyramid into named arrays so it can be stored
+        alongside other products in an .npz file.
+        '''
+
+        arrays = {f"{prefix}quicklook_lengths": np.array([len(level["x"]) for level in self.levels])}
+
+        for k, level in enumerate(self.levels):
+            for field in FIELDS:
+                arrays[f"{prefix}quicklook_{k}_{field}"] = level[field]
+
+        return arrays
+
+    def save(self, output_path: str, prefix: str = ""):
+        '''
+        Save the pyramid to an .npz file.
+        '''
+
+        np.savez(output_path, **self.to_arrays(prefix))
+
+
+def read_level(file_path: str, width: int, prefix: str = ""):
+    '''
+    Read a single level of a stored pyramid without loading the others.
+    '''
+
+    with np.load(file_path) as products:
+        lengths = products[f"{prefix}quicklook_lengths"]
+
+        # Use the finest level that fits the width, or the coarsest if none do
+        fitting = np.flatnonzero(lengths <= width)
+        k = int(fitting[0]) if len(fitting) else len(lengths) - 1
+
+        return {field: products[f"{prefix}quicklook_{k}_{field}"] for field in FIELDS}
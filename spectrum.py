@@ -2,10 +2,11 @@ import numpy as np
 from astropy.io import fits
 from astropy.table import Table
 import utils
+from bandpass import Bandpass
 
 
 class Spectrum:
-    def __init__(self, file_path: str, ifnum, plnum, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges):
+    def __init__(self, file_path: str, ifnum, plnum, including_frequency_ranges, excluding_frequency_ranges, including_time_ranges, excluding_time_ranges, cache=None):
         '''
         Initialization function for provided file. Responsible for 
         opening the SDFITS file's header and data and initializing 
@@ -13,10 +14,12 @@ class Spectrum:
         '''
         
         self.filepath = file_path
+        self.cache = cache
 
         with fits.open(self.filepath) as hdul:
             self.header = hdul[0].header
             self.data = Table(hdul[1].data)
+            self.data['DATA'] = utils.as_cube(self.data['DATA'])
         
             # Find total number of feeds and channels
             ifnums = np.unique(self.data['IFNUM'])
@@ -27,7 +30,13 @@ class Spectrum:
 
             self.data = self.data[
                 (self.data['IFNUM'] == ifnum) &
-                (self.data['PLNUM'] == plnum) &
+                (self.data['PLNUM'] == plnum)
+            ]
+
+            # Keep the calibration spikes for bandpass calibration
+            self.calibration_data = self.data
+
+            self.data = self.data[
                 (self.data['CALSTATE'] == 0) & 
                 (self.data['SWPVALID'] == 0)
             ]
@@ -42,13 +51,48 @@ class Spectrum:
             # Accept time ranges
             self.including_time_ranges = including_time_ranges
             self.excluding_time_ranges = excluding_time_ranges
+
+            self.baseline = None
+            self.bandpass = False
+
+    def _cached(self, stage, compute, **params):
+        '''
+        Look up a stage result in the product cache, computing it on a miss. 
+        Entries are keyed on the file contents, the rows selected by feed, 
+        polarization and time, and any further parameters the stage depends on.
+        '''
+
+        if self.cache is None:
+            return compute()
+
+        key = self.cache.key(
+            self.filepath, stage,
+            ifnum=self.ifnum, plnum=self.plnum,
+            including_time_ranges=self.including_time_ranges,
+            excluding_time_ranges=self.excluding_time_ranges,
+            **params
+        )
+
+        return self.cache.fetch(key, compute)
             
-    def spectrum(self):
+    def spectrum(self, baseline=None, bandpass=False):
         '''
         Create the spectrum and crop out unnecessary times and frequencies. Handle
-        ON/OFF files.
+        ON/OFF files. If bandpass is set every channel is first converted to 
+        calibration units using the noise diode, except channels without a 
+        positive diode step, which are flagged in bandpass_calibration.uncalibrated. 
+        If a Baseline is provided it is removed from every integration or from 
+        the final spectrum, depending on its mode.
         '''
 
+        self.baseline = baseline
+        self.bandpass = bandpass
+
+        # Calibrate each channel before any channels are cropped
+        if self.bandpass:
+            self.bandpass_calibration = Bandpass(self.header, self.calibration_data, self.channel_count)
+            self.data['DATA'] = self.bandpass_calibration.apply(self.data['DATA'])
+
         if self.including_time_ranges or self.excluding_time_ranges:
             self.data = utils.filter_time_ranges(self.header, self.data, self.including_time_ranges, self.excluding_time_ranges)
         if self.including_frequency_ranges or self.excluding_frequency_ranges:
@@ -57,16 +101,48 @@ class Spectrum:
             frequencies = utils.get_frequency_range(self.header, self.ifnum)
             frequencies = np.linspace(frequencies[1], frequencies[0], frequencies[2])
 
-        data_start_index, post_cal_start_index, off_start_index = utils.find_calibrations(self.header, self.data, self.channel_count)
+        # Remove the baseline from every integration at once
+        if self.baseline is not None and self.baseline.per_integration:
+            self.data['DATA'] = self.baseline.subtract(frequencies, self.data['DATA'])
+
+        data_start_index, post_cal_start_index, off_start_index = self._cached(
+            "spectrum_segments",
+            lambda: utils.find_calibrations(self.header, self.data, self.channel_count)
+        )
         self.off_start_index = off_start_index    
 
+        # The sums depend on the channels kept and on everything applied to 
+        # them before summing, which excludes a final-spectrum baseline
+        channels = {
+            "including_frequency_ranges": self.including_frequency_ranges,
+            "excluding_frequency_ranges": self.excluding_frequency_ranges,
+            "precision": utils.PRECISION,
+            "bandpass": self.bandpass,
+            "baseline": self.baseline if self.baseline is not None and self.baseline.per_integration else None,
+        }
+
         if self.off_start_index:
-            on_spectrum = utils.integrate_data(self.header, self.data['DATA'][:self.off_start_index], "spectrum")
-            off_spectrum = utils.integrate_data(self.header, self.data['DATA'][self.off_start_index:], "spectrum")
+            on_spectrum = self._cached(
+                "spectrum_on",
+                lambda: utils.integrate_data(self.header, self.data['DATA'][:self.off_start_index], "spectrum"),
+                **channels
+            )
+            off_spectrum = self._cached(
+                "spectrum_off",
+                lambda: utils.integrate_data(self.header, self.data['DATA'][self.off_start_index:], "spectrum"),
+                **channels
+            )
 
             spectrum = on_spectrum - off_spectrum
         else:
-            spectrum = utils.integrate_data(self.header, self.data['DATA'], "spectrum")
+            spectrum = self._cached(
+                "spectrum_total",
+                lambda: utils.integrate_data(self.header, self.data['DATA'], "spectrum"),
+                **channels
+            )
+
+        if self.baseline is not None and not self.baseline.per_integration:
+            spectrum = self.baseline.subtract(frequencies, spectrum)
 
         return [frequencies, spectrum]
 
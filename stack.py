@@ -0,0 +1,161 @@
+import numpy as np
+
+
+# Speed of light in km/s
+SPEED_OF_LIGHT = 299792.458
+
+
+class Stack:
+    def __init__(self, grid, axis: str = "frequency", rest_frequency: float = None):
+        '''
+        Initialization function for a stack on a common grid of frequencies
+        (MHz) or radio-convention velocities (km/s). Only running sums are
+        kept, so memory does not grow with the number of spectra.
+        '''
+
+        if axis not in ("frequency", "velocity"):
+            raise ValueError(f"Unknown stacking axis: {axis}")
+        if axis == "velocity" and rest_frequency is None:
+            raise ValueError("A rest frequency is required to stack in velocity")
+
+        self.grid = np.asarray(grid, dtype=np.float64)
+        self.axis = axis
+        self.rest_frequency = rest_frequency
+
+        # Weighted running mean and sum of squared deviations for every channel
+        self.weight = np.zeros(len(self.grid))
+        self.mean = np.zeros(len(self.grid))
+        self.m2 = np.zeros(len(self.grid))
+        self.count = np.zeros(len(self.grid), dtype=np.int64)
+
+        # Spectra that were not added for lack of a weight or of overlap with the grid
+        self.skipped = 0
+
+    def _to_axis(self, frequencies):
+        '''
+        Convert a frequency axis (MHz) to the stacking axis.
+        '''
+
+        frequencies = np.asarray(frequencies, dtype=np.float64)
+
+        if self.axis == "velocity":
+            return SPEED_OF_LIGHT * (self.rest_frequency - frequencies) / self.rest_frequency
+
+        return frequencies
+
+    def _noise_weight(self, spectrum):
+        '''
+        Inverse-variance weight from the robust scatter of channel-to-channel differences. 
+        A spectrum whose scatter is zero, such as one with more than half its channels 
+        flagged to a constant, has no usable noise estimate and gets no weight.
+        '''
+
+        differences = np.diff(spectrum[np.isfinite(spectrum)])
+        if len(differences) == 0:
+            return 0.0
+
+        sigma = 1.4826 * np.median(np.abs(differences - np.median(differences))) / np.sqrt(2)
+
+        return 1.0 / sigma ** 2 if sigma > 0 else 0.0
+
+    def add(self, frequencies, spectrum, weight: float = None):
+        '''
+        Regrid a spectrum onto the stack's grid and fold it into the running
+        sums. Grid channels outside the spectrum's coverage are left untouched.
+        The weight defaults to the inverse noise variance of the spectrum. 
+        Spectra without a positive weight are skipped and counted in skipped; 
+        pass an explicit weight to stack them.
+        '''
+
+        x = self._to_axis(frequencies)
+        y = np.asarray(spectrum, dtype=np.float64)
+
+        # Interpolation needs an increasing axis
+        order = np.argsort(x)
+        values = np.interp(self.grid, x[order], y[order], left=np.nan, right=np.nan)
+
+        if weight is None:
+            weight = self._noise_weight(y)
+
+        valid = np.isfinite(values)
+        if weight <= 0 or not np.any(valid):
+            self.skipped += 1
+            return
+
+        # Weighted incremental (West/Welford) update of the mean and squared deviations
+        values = values[valid]
+        new_weight = self.weight[valid] + weight
+        delta = values - self.mean[valid]
+        self.mean[valid] += (weight / new_weight) * delta
+        self.m2[valid] += weight * delta * (values - self.mean[valid])
+        self.weight[valid] = new_weight
+        self.count[valid] += 1
+
+    def consume(self, spectra):
+        '''
+        Add every (frequencies, spectrum) pair from an iterable, such as a generator.
+        '''
+
+        for frequencies, spectrum in spectra:
+            self.add(frequencies, spectrum)
+
+    def add_files(self, file_paths, ifnum, plnum, including_time_ranges=None, excluding_time_ranges=None, baseline=None, bandpass=False, cache=None):
+        '''
+        Create and add the spectrum of every file one at a time, so only
+        a single spectrum is held in memory.
+        '''
+
+        from spectrum import Spectrum
+
+        for file_path in file_paths:
+            s = Spectrum(file_path, ifnum, plnum, None, None, including_time_ranges, excluding_time_ranges, cache=cache)
+            frequencies, spectrum = s.spectrum(baseline=baseline, bandpass=bandpass)
+
+            self.add(frequencies, spectrum)
+
+    def add_products(self, products_paths, ifnum, plnum):
+        '''
+        Add spectra from the products files written by the ingest service.
+        '''
+
+        for products_path in products_paths:
+            with np.load(products_path) as products:
+                key = f"spectrum_{ifnum}_{plnum}"
+                if f"{key}_frequency" in products:
+                    self.add(products[f"{key}_frequency"], products[f"{key}_intensity"])
+
+    @property
+    def variance(self):
+        '''
+        Weighted variance of the stacked spectra in every channel.
+        '''
+
+        return np.divide(self.m2, self.weight, out=np.full(len(self.grid), np.nan), where=self.weight > 0)
+
+    @property
+    def error(self):
+        '''
+        Standard error of the stacked mean for inverse-variance weights.
+        '''
+
+        return np.divide(1.0, np.sqrt(self.weight), out=np.full(len(self.grid), np.nan), where=self.weight > 0)
+
+    def result(self):
+        '''
+        Return the stacked spectrum. Channels no spectrum covered are NaN.
+        '''
+
+        mean = np.where(self.count > 0, self.mean, np.nan)
+
+        return [self.grid, mean]
+
+
+if __name__ == "__main__":
+    filepaths = [
+        "C:/Users/starb/Downloads/0144767_validated_corrected.fits",
+        "C:/Users/starb/Downloads/0144768_validated_corrected.fits",
+    ]
+
+    stack = Stack(np.linspace(1415, 1425, 1024))
+    stack.add_files(filepaths, 0, 0)
+    frequencies, spectrum = stack.result()
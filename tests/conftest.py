@@ -0,0 +1,83 @@
+import os
+import sys
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import Table
+from astropy.time import Time, TimeDelta
+
+# The pipeline modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utils
+
+
+def make_sdfits(path, rows=120, channels=64, seed=0):
+    '''
+    Write a small float64 on/off SDFITS file with one feed, two
+    polarizations and five-row diode spikes at both ends.
+    '''
+
+    rng = np.random.default_rng(seed)
+    t0 = Time("2025-01-01T00:00:00", format="isot")
+
+    columns = {column: [] for column in ("DATA", "DATE-OBS", "CALSTATE", "SWPVALID", "IFNUM", "PLNUM", "OBSMODE")}
+    physical = ("DURATION", "EXPOSURE", "TSYS", "TCAL", "LST", "RESTFREQ", "FREQRES", "TRGTLONG", "MJD", "UTSECS")
+    columns.update({column: [] for column in physical + ("ELEVATIO", "TAMBIENT", "PRESSURE", "HUMIDITY")})
+
+    for k in range(rows):
+        for plnum in (0, 1):
+            # Diode on then off before and after the observation, which is marked SWPVALID
+            if k < 10:
+                calstate, swpvalid = int(k < 5), 0
+            elif k >= rows - 10:
+                calstate, swpvalid = int(k < rows - 5), 0
+            else:
+                calstate, swpvalid = 0, 1
+
+            level = 100 + 10 * np.sin(np.linspace(0, 3, channels)) + 20 * calstate
+            columns["DATA"].append(level + rng.normal(0, 1, channels))
+            columns["DATE-OBS"].append((t0 + TimeDelta(k, format="sec")).isot)
+            columns["CALSTATE"].append(calstate)
+            columns["SWPVALID"].append(swpvalid)
+            columns["IFNUM"].append(0)
+            columns["PLNUM"].append(plnum)
+            columns["OBSMODE"].append("onoff:on" if k < rows // 2 else "onoff:off")
+
+            for column in physical:
+                columns[column].append(1.0)
+            columns["ELEVATIO"].append(30 + 0.05 * k)
+            columns["TAMBIENT"].append(10.0)
+            columns["PRESSURE"].append(1000.0)
+            columns["HUMIDITY"].append(50.0)
+
+    header = fits.Header()
+    header["DATE"] = t0.isot
+    header["OBSMODE"] = "onoff"
+    header["OBSBW"] = 100.0
+    header["OBSFREQ"] = 1400.0
+    header["OBJECT"] = "Cas A"
+    header["HISTORY"] = "DATAMODE LOWRES"
+    header["HISTORY"] = f"START,STOP channels 2,{channels - 3}"
+    header["HISTORY"] = "RFFILTER 1350_1450"
+
+    table = Table({column: np.array(values) for column, values in columns.items()})
+    fits.HDUList([fits.PrimaryHDU(header=header), fits.BinTableHDU(table)]).writeto(path)
+
+    return str(path)
+
+
+@pytest.fixture
+def sdfits(tmp_path):
+    return make_sdfits(tmp_path / "observation.fits")
+
+
+@pytest.fixture
+def precision():
+    '''
+    Restore the global precision policy after a test changes it.
+    '''
+
+    previous = utils.PRECISION
+    yield utils.set_precision
+    utils.set_precision(previous)
@@ -0,0 +1,108 @@
+import os
+import numpy as np
+import pytest
+import utils
+import validate
+from cache import Cache
+from validate import Validation
+from atmosphere_correction import Atmosphere_Correction
+from continuum import Continuum
+from spectrum import Spectrum
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return Cache(str(tmp_path / "cache"))
+
+@pytest.fixture
+def validated(sdfits):
+    Validation(sdfits).validate()
+
+    return sdfits.replace(".fits", "_validated.fits")
+
+@pytest.fixture
+def calls(monkeypatch):
+    '''
+    Count the calls of the stage computations the cache stands in for.
+    '''
+
+    counts = {"find_calibrations": 0, "integrate_data": 0}
+
+    for name in counts:
+        function = getattr(utils, name)
+
+        def counted(*args, name=name, function=function, **kwargs):
+            counts[name] += 1
+            return function(*args, **kwargs)
+
+        monkeypatch.setattr(utils, name, counted)
+
+    return counts
+
+
+def test_cache_hit_returns_same_products(validated, cache, calls):
+    continuum = Continuum(validated, 0, 0, None, None, None, None, cache=cache).continuum()
+    spectrum = Spectrum(validated, 0, 0, None, None, None, None, cache=cache).spectrum()
+    entries = len(os.listdir(cache.cache_dir))
+
+    for name in calls:
+        calls[name] = 0
+
+    cached_continuum = Continuum(validated, 0, 0, None, None, None, None, cache=cache).continuum()
+    cached_spectrum = Spectrum(validated, 0, 0, None, None, None, None, cache=cache).spectrum()
+
+    assert calls == {"find_calibrations": 0, "integrate_data": 0}
+    assert len(os.listdir(cache.cache_dir)) == entries
+
+    np.testing.assert_array_equal(cached_continuum[0], continuum[0])
+    np.testing.assert_array_equal(cached_continuum[1], continuum[1])
+    np.testing.assert_array_equal(cached_spectrum[0], spectrum[0])
+    np.testing.assert_array_equal(cached_spectrum[1], spectrum[1])
+
+
+def test_frequency_ranges_reuse_segments(validated, cache, calls):
+    for including in ([[1360, 1400]], [[1400, 1440]], [[1360, 1400]]):
+        Continuum(validated, 0, 0, including, None, None, None, cache=cache).continuum()
+
+    assert calls["find_calibrations"] == 1
+
+    for including in ([[1360, 1400]], [[1400, 1440]]):
+        Spectrum(validated, 0, 0, including, None, None, None, cache=cache).spectrum()
+
+    assert calls["find_calibrations"] == 2
+
+    # New time ranges select other rows, so the segments are found again
+    Continuum(validated, 0, 0, [[1360, 1400]], None, [[0, 100]], None, cache=cache).continuum()
+
+    assert calls["find_calibrations"] == 3
+
+
+def test_validation_cache_hit_skips_the_file(sdfits, cache, monkeypatch):
+    Validation(sdfits, cache=cache).validate()
+    output_path = sdfits.replace(".fits", "_validated.fits")
+    modified = os.stat(output_path).st_mtime_ns
+
+    def fail(file_path):
+        raise AssertionError("The input was read on a cache hit")
+
+    monkeypatch.setattr(validate, "prevalidate", fail)
+
+    Validation(sdfits, cache=cache).validate()
+    assert os.stat(output_path).st_mtime_ns == modified
+
+    # A changed output is no longer a hit
+    os.utime(output_path, ns=(modified + 10 ** 9, modified + 10 ** 9))
+    with pytest.raises(AssertionError):
+        Validation(sdfits, cache=cache)
+
+
+def test_atmosphere_cache_hit_keeps_statistics(validated, cache):
+    first = Atmosphere_Correction(validated, cache=cache)
+    first.atmosphere_correction(approximate=True)
+
+    second = Atmosphere_Correction(validated, cache=cache)
+    second.atmosphere_correction(approximate=True)
+
+    assert second.data is None
+    assert second.model_evaluations == first.model_evaluations > 0
+    assert second.max_interpolation_error == first.max_interpolation_error
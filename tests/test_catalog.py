@@ -0,0 +1,27 @@
+import os
+from conftest import make_sdfits
+from catalog import Catalog
+
+
+def test_update_catalogs_new_files_and_drops_vanished_ones(tmp_path, monkeypatch):
+    make_sdfits(tmp_path / "a.fits")
+    make_sdfits(tmp_path / "b.fits", seed=1)
+
+    catalog = Catalog(str(tmp_path / "catalog.sqlite"))
+    try:
+        assert catalog.update(str(tmp_path), workers=2) == (2, 0)
+        assert sorted(os.path.basename(o["path"]) for o in catalog.query(source="cas a", band="L")) == ["a.fits", "b.fits"]
+
+        # Nothing changed, so no header is read again
+        assert catalog.update(str(tmp_path), workers=2) == (0, 0)
+
+        # A file removed between the scan and reading its header is dropped, not fatal
+        scan = Catalog._scan
+        vanished = str(tmp_path / "vanished.fits")
+        monkeypatch.setattr(Catalog, "_scan", lambda self, directory: scan(self, directory) + [vanished])
+
+        os.remove(tmp_path / "b.fits")
+        assert catalog.update(str(tmp_path), workers=2) == (0, 1)
+        assert [os.path.basename(o["path"]) for o in catalog.query()] == ["a.fits"]
+    finally:
+        catalog.close()
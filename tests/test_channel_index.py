@@ -0,0 +1,71 @@
+import os
+import numpy as np
+import pytest
+from astropy.io import fits
+from astropy.table import Table
+import utils
+from validate import Validation
+from continuum import Continuum
+
+# The fixture's band runs from 1350 to 1450 MHz
+RANGES = [
+    ([[1370, 1400]], None),
+    (None, [[1390, 1410]]),
+    ([[1360, 1380], [1400, 1440]], [[1410, 1420]]),
+]
+
+
+@pytest.fixture
+def validated(sdfits):
+    Validation(sdfits).validate(channel_index=True)
+
+    return sdfits.replace(".fits", "_validated.fits")
+
+
+@pytest.mark.parametrize("including, excluding", RANGES)
+def test_index_sums_match_direct_sums(validated, including, excluding):
+    with fits.open(validated) as hdul:
+        header = hdul[0].header
+        data = Table(hdul[1].data)
+
+    channel_index = utils.load_channel_index(validated, len(data))
+    frequencies, sums = utils.sum_frequency_ranges(header, channel_index, 0, including, excluding)
+
+    direct_frequencies, data['DATA'] = utils.filter_frequency_ranges(header, data, 0, including, excluding)
+    direct_sums = utils.integrate_data(header, data, "continuum")[1]
+
+    np.testing.assert_array_equal(frequencies, direct_frequencies)
+    np.testing.assert_allclose(sums, direct_sums, rtol=1e-13)
+
+
+@pytest.mark.parametrize("including, excluding", RANGES)
+def test_index_continuum_matches_direct_continuum(validated, including, excluding):
+    indexed = Continuum(validated, 0, 0, including, excluding, None, None)
+    assert indexed.channel_index is not None
+    indexed_continuum = indexed.continuum()
+
+    os.remove(utils.channel_index_path(validated))
+
+    direct = Continuum(validated, 0, 0, including, excluding, None, None)
+    assert direct.channel_index is None
+    direct_continuum = direct.continuum()
+
+    np.testing.assert_array_equal(indexed_continuum[0], direct_continuum[0])
+    np.testing.assert_allclose(indexed_continuum[1], direct_continuum[1], rtol=1e-13)
+
+
+def test_stale_index_is_ignored(validated):
+    n_rows = len(Table.read(validated, hdu=1))
+    assert utils.load_channel_index(validated, n_rows) is not None
+
+    # A file rewritten after its index was built makes the index stale
+    index_time = os.path.getmtime(utils.channel_index_path(validated))
+    os.utime(validated, (index_time + 10, index_time + 10))
+
+    assert not utils.has_channel_index(validated)
+    assert utils.load_channel_index(validated, n_rows) is None
+    assert Continuum(validated, 0, 0, None, None, None, None).channel_index is None
+
+    # An index describing a different number of rows is ignored as well
+    os.utime(validated, (index_time, index_time))
+    assert utils.load_channel_index(validated, n_rows - 1) is None
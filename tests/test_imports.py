@@ -0,0 +1,40 @@
+import os
+import sys
+import json
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only loaded by the stages that need them, never at import time
+HEAVY_MODULES = ("itur", "scipy", "rcr", "matplotlib")
+
+
+def import_main():
+    '''
+    Import main in a fresh interpreter, so modules loaded by other tests do not
+    count. Returns the heavy modules it loaded and its cumulative import time in
+    seconds as reported by -X importtime.
+    '''
+
+    code = f"import sys, json, main; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    # Lines read "import time: self [us] | cumulative | imported package"
+    seconds = None
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == "main":
+            seconds = int(fields[1]) / 1e6
+
+    return json.loads(result.stdout.splitlines()[-1]), seconds
+
+
+def test_main_does_not_import_heavy_modules(record_property):
+    loaded, seconds = import_main()
+
+    # The import time depends on the machine, so it is reported rather than bounded
+    record_property("import_main_seconds", seconds)
+    print(f"import main: {seconds:.3f} s")
+
+    assert loaded == []
+    assert seconds is not None
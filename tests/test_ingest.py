@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import asyncio
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from conftest import make_sdfits
+from ingest import Ingest, run_pipeline
+
+
+def run_service(ingest, files, timeout=20.0):
+    '''
+    Run the service until every file has a final status record.
+    '''
+
+    async def main():
+        task = asyncio.create_task(ingest.run())
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            states = [status(ingest, path)["state"] for path in files if status(ingest, path)]
+            if len(states) == len(files) and all(state in ("done", "failed") for state in states):
+                break
+            await asyncio.sleep(0.05)
+
+        ingest.stop()
+        await task
+
+    asyncio.run(main())
+
+def status(ingest, path):
+    try:
+        with open(ingest._status_path(path)) as f:
+            return json.load(f)
+    except OSError:
+        return None
+
+def service(watch_dir, process, **kwargs):
+    kwargs = {"settle_time": 0.2, "poll_interval": 0.05, "retry_delay": 0.05, **kwargs}
+    return Ingest(str(watch_dir), process=process, executor=ThreadPoolExecutor(2), **kwargs)
+
+
+def test_reduces_files_and_fails_corrupt_files_at_once(tmp_path):
+    good = make_sdfits(tmp_path / "good.fits")
+    corrupt = str(tmp_path / "corrupt.fits")
+    with open(corrupt, "w") as f:
+        f.write("not a FITS file")
+
+    ingest = service(tmp_path, partial(run_pipeline, atmosphere_correction=False))
+    run_service(ingest, [good, corrupt])
+
+    assert status(ingest, good)["state"] == "done"
+    assert os.path.exists(status(ingest, good)["result"]["products"])
+
+    # Validation errors are deterministic and are not retried
+    assert status(ingest, corrupt)["state"] == "failed"
+    assert status(ingest, corrupt)["attempts"] == 1
+    assert "ValueError" in status(ingest, corrupt)["error"]
+
+    # Pipeline outputs written next to the file are never ingested themselves
+    assert status(ingest, good.replace(".fits", "_validated.fits")) is None
+
+
+def test_retries_transient_errors(tmp_path):
+    path = make_sdfits(tmp_path / "observation.fits")
+    calls = []
+
+    def flaky(file_path):
+        calls.append(file_path)
+        if len(calls) == 1:
+            raise OSError("Share temporarily unavailable")
+        return "ok"
+
+    ingest = service(tmp_path, flaky)
+    run_service(ingest, [path])
+
+    assert status(ingest, path)["state"] == "done"
+    assert status(ingest, path)["attempts"] == 2
+    assert len(calls) == 2
+
+
+def test_waits_for_files_to_stop_changing(tmp_path):
+    path = str(tmp_path / "arriving.fits")
+    seen = []
+
+    def record(file_path):
+        seen.append((time.monotonic(), os.path.getsize(file_path)))
+        return "ok"
+
+    ingest = service(tmp_path, record, settle_time=0.5)
+
+    async def main():
+        task = asyncio.create_task(ingest.run())
+
+        # Write the file in pieces more often than the settle time
+        for _ in range(10):
+            with open(path, "ab") as f:
+                f.write(b"\0" * 2880)
+            await asyncio.sleep(0.1)
+        finished = time.monotonic()
+
+        while status(ingest, path) is None or status(ingest, path)["state"] != "done":
+            await asyncio.sleep(0.05)
+
+        ingest.stop()
+        await task
+
+        return finished
+
+    finished = asyncio.run(main())
+
+    assert len(seen) == 1
+    assert seen[0][1] == 10 * 2880
+    assert seen[0][0] - finished >= 0.3
+
+
+def test_survives_status_write_failures(tmp_path):
+    path = make_sdfits(tmp_path / "observation.fits")
+    calls = []
+
+    ingest = service(tmp_path, lambda file_path: calls.append(file_path))
+
+    # Every status write now fails
+    ingest.status_dir = str(tmp_path / "missing")
+
+    async def main():
+        task = asyncio.create_task(ingest.run())
+        while not calls:
+            await asyncio.sleep(0.05)
+
+        # Returns only if the worker is still alive to finish the queue
+        ingest.stop()
+        await asyncio.wait_for(task, 5)
+
+    asyncio.run(main())
+
+    assert calls[0] == path
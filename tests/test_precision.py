@@ -0,0 +1,53 @@
+import shutil
+import numpy as np
+from astropy.io import fits
+from validate import Validation
+from continuum import Continuum
+from spectrum import Spectrum
+
+# float32 rounds every stored sample to within 6e-8 of its value. Sums accumulate in
+# float64, so a continuum of positive row sums stays within this relative tolerance.
+TOLERANCE = 1e-6
+
+
+def reduce(file_path, precision, set_precision):
+    set_precision(precision)
+
+    Validation(file_path).validate()
+    validated_path = file_path.replace(".fits", "_validated.fits")
+
+    continuum = Continuum(validated_path, 0, 0, None, None, None, None).continuum()
+    spectrum = Spectrum(validated_path, 0, 0, None, None, None, None).spectrum()
+
+    with fits.open(validated_path) as hdul:
+        dtype = hdul[1].data["DATA"].dtype
+
+    return continuum, spectrum, dtype
+
+
+def test_float32_within_tolerance_of_float64(sdfits, precision):
+    float32_path = sdfits.replace(".fits", "_float32.fits")
+    shutil.copy(sdfits, float32_path)
+
+    continuum64, spectrum64, dtype64 = reduce(sdfits, "input", precision)
+    continuum32, spectrum32, dtype32 = reduce(float32_path, "float32", precision)
+
+    assert dtype64.itemsize == 8
+    assert dtype32.itemsize == 4
+
+    # The products themselves stay float64
+    assert continuum32[1].dtype == np.float64
+    assert spectrum32[1].dtype == np.float64
+
+    np.testing.assert_array_equal(continuum32[0], continuum64[0])
+    np.testing.assert_allclose(continuum32[1], continuum64[1], rtol=TOLERANCE)
+
+    # An on/off spectrum is a small difference of large sums over rows, so its error is
+    # bounded by the rounding of every summed sample rather than relative to the difference
+    with fits.open(sdfits) as hdul:
+        data = hdul[1].data
+        rows = np.count_nonzero((data["IFNUM"] == 0) & (data["PLNUM"] == 0) & (data["CALSTATE"] == 0) & (data["SWPVALID"] == 0))
+        level = np.max(np.abs(data["DATA"]))
+
+    np.testing.assert_array_equal(spectrum32[0], spectrum64[0])
+    assert np.max(np.abs(spectrum32[1] - spectrum64[1])) <= rows * np.finfo(np.float32).eps / 2 * level
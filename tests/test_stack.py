@@ -0,0 +1,53 @@
+import numpy as np
+from stack import Stack
+
+
+def test_running_mean_and_variance_match_direct_calculation():
+    rng = np.random.default_rng(1)
+    grid = np.linspace(1400, 1420, 200)
+
+    spectra = [rng.normal(5, 2, len(grid)) for _ in range(20)]
+    weights = rng.uniform(0.5, 3.0, len(spectra))
+
+    stack = Stack(grid)
+    for spectrum, weight in zip(spectra, weights):
+        stack.add(grid, spectrum, weight=weight)
+
+    mean = np.average(spectra, axis=0, weights=weights)
+    variance = np.sum(weights[:, np.newaxis] * (np.array(spectra) - mean) ** 2, axis=0) / np.sum(weights)
+
+    np.testing.assert_allclose(stack.result()[1], mean, rtol=1e-12)
+    np.testing.assert_allclose(stack.variance, variance, rtol=1e-12)
+    np.testing.assert_allclose(stack.error, 1 / np.sqrt(np.sum(weights)), rtol=1e-12)
+    assert np.all(stack.count == len(spectra))
+
+
+def test_partial_coverage_only_updates_covered_channels():
+    grid = np.linspace(0, 10, 11)
+
+    stack = Stack(grid)
+    stack.add(np.linspace(0, 4, 5), np.ones(5), weight=1.0)
+
+    mean = stack.result()[1]
+    assert np.all(mean[:5] == 1.0)
+    assert np.all(np.isnan(mean[5:]))
+
+
+def test_spectra_without_noise_estimate_are_skipped():
+    rng = np.random.default_rng(2)
+    grid = np.linspace(1400, 1420, 100)
+
+    stack = Stack(grid)
+    stack.add(grid, rng.normal(0, 1, len(grid)))
+
+    # More than half the channels flagged to a constant leaves no robust scatter
+    flagged = rng.normal(0, 1, len(grid))
+    flagged[:70] = 0.0
+    stack.add(grid, flagged)
+
+    assert stack.skipped == 1
+    assert np.all(stack.count == 1)
+
+    # An explicit weight still stacks it
+    stack.add(grid, flagged, weight=1.0)
+    assert np.all(stack.count == 2)
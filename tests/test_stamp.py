@@ -0,0 +1,50 @@
+import time
+import hashlib
+import pytest
+from astropy.io import fits
+import utils
+from validate import Validation
+
+
+def sha256(file_path):
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def test_saves_are_byte_identical(sdfits):
+    validated_path = sdfits.replace(".fits", "_validated.fits")
+
+    Validation(sdfits).validate()
+    first = sha256(validated_path)
+
+    # Checksum comments written with a timestamp would differ a second later
+    time.sleep(1.1)
+
+    Validation(sdfits).validate()
+
+    assert sha256(validated_path) == first
+
+
+def test_stamped_file_checks_datasum(sdfits):
+    Validation(sdfits).validate()
+    validated_path = sdfits.replace(".fits", "_validated.fits")
+
+    with fits.open(validated_path) as hdul:
+        assert utils.is_stamped(hdul)
+        assert utils.datasum(hdul, chunk_size=2880) == int(hdul[1].header["DATASUM"])
+        utils.verify(hdul)
+
+        data_start = hdul.fileinfo(1)["datLoc"]
+
+    # Flip a byte of the table data, which leaves every header intact
+    with open(validated_path, "r+b") as f:
+        f.seek(data_start + 100)
+        byte = f.read(1)
+        f.seek(data_start + 100)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    with fits.open(validated_path) as hdul:
+        assert utils.is_stamped(hdul)
+
+        with pytest.raises(ValueError, match="DATASUM"):
+            utils.verify(hdul)
@@ -0,0 +1,29 @@
+import pytest
+from astropy.io import fits
+from validate import prevalidate
+from file_corruption import EXPECTED_OUTCOMES, fuzz
+
+
+def test_prevalidate_accepts_clean_file(sdfits):
+    prevalidate(sdfits)
+
+
+def test_prevalidate_rejects_channel_range_beyond_data(sdfits):
+    # The fixture holds 64 channels, so channel 64 does not exist
+    with fits.open(sdfits, mode="update") as hdul:
+        header = hdul[0].header
+        for i, card in enumerate(header.cards):
+            if card.keyword == "HISTORY" and str(card.value).startswith("START,STOP"):
+                header[i] = "START,STOP channels 5,64"
+
+    with pytest.raises(ValueError, match="outside the 64 channels"):
+        prevalidate(sdfits)
+
+
+def test_fuzzed_variants_are_rejected_by_the_expected_stage(sdfits, tmp_path):
+    reports = fuzz(sdfits, str(tmp_path / "fuzz"), copies=2, workers=2)
+
+    assert sorted(report["kind"] for report in reports) == sorted(list(EXPECTED_OUTCOMES) * 2)
+
+    for report in reports:
+        assert report["passed"], report
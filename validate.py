@@ -1,12 +1,136 @@
+import re
 import numpy as np
 from astropy.io import fits
-from astropy.table import Table
+from astropy.table import Table, MaskedColumn
 from astropy.time import Time
 import utils
 
 
+# Primary header cards the later stages rely on
+REQUIRED_CARDS = ["DATE", "OBSMODE", "OBSBW", "OBSFREQ"]
+
+# Binary table columns and the TFORM type codes they may have
+REQUIRED_COLUMNS = {
+    "DATA": "ED",
+    "DATE-OBS": "A",
+    "OBSMODE": "A",
+    "CALSTATE": "BIJKED",
+    "SWPVALID": "BIJKED",
+    "IFNUM": "BIJKED",
+    "PLNUM": "BIJKED",
+}
+
+# Physical quantities that must be numeric. Validation drops rows where any is negative.
+NUMERIC_COLUMNS = ["DURATION", "EXPOSURE", "TSYS", "TCAL", "LST", "ELEVATIO", "TAMBIENT", "PRESSURE",
+                    "HUMIDITY", "RESTFREQ", "FREQRES", "TRGTLONG", "MJD", "UTSECS"]
+
+# Bytes per element of each TFORM type code
+TFORM_WIDTHS = {"L": 1, "B": 1, "I": 2, "J": 4, "K": 8, "A": 1, "E": 4, "D": 8, "C": 8, "M": 16, "P": 8, "Q": 16}
+
+
+def _parse_tform(tform):
+    '''
+    Split a binary table TFORM value into its repeat count, type code and row width in bytes.
+    '''
+
+    match = re.match(r'^\s*(\d*)([A-Z])', tform)
+    if match is None:
+        raise ValueError(f"Unreadable TFORM: {tform}")
+
+    repeat = int(match.group(1)) if match.group(1) else 1
+    code = match.group(2)
+
+    if code == "X":
+        width = (repeat + 7) // 8
+    elif code in TFORM_WIDTHS:
+        width = repeat * TFORM_WIDTHS[code]
+    else:
+        raise ValueError(f"Unknown TFORM type code: {tform}")
+
+    return repeat, code, width
+
+def prevalidate(file_path: str):
+    '''
+    Cheaply reject malformed files before any data is read. Only the 
+    headers are parsed: required cards, the HISTORY metadata, the column 
+    types and whether the file is large enough to hold the table.
+    Raises ValueError describing the first problem found.
+    '''
+
+    try:
+        with fits.open(file_path, memmap=True, lazy_load_hdus=True) as hdul:
+            header = hdul[0].header
+            table_header = hdul[1].header
+            truncated = utils.is_truncated(hdul)
+
+            # Files written by the reduction stages only hold the channels in the range
+            cropped = header.get('PIPESTG') in ("validated", "corrected") and utils.is_stamped(hdul)
+    except Exception as e:
+        raise ValueError(f"Unreadable FITS structure: {e}") from e
+
+    # Ensure the cards used by the later stages exist
+    for card in REQUIRED_CARDS:
+        if card not in header:
+            raise ValueError(f"Missing primary header card {card}")
+
+    try:
+        Time(header["DATE"], format="isot")
+    except ValueError as e:
+        raise ValueError(f"Unparseable DATE: {header['DATE']}") from e
+
+    # Ensure the HISTORY metadata describes the channel range and the band
+    history = utils.parse_history(header)
+
+    channels = history.get('START,STOP channels')
+    if not isinstance(channels, list) or len(channels) != 2:
+        raise ValueError("Missing HISTORY START,STOP channels")
+
+    datamode = history.get('DATAMODE')
+    if datamode == 'HIRES' and 'HIRES bands' not in history:
+        raise ValueError("Missing HISTORY HIRES bands")
+    elif datamode == 'LOWRES' and 'RFFILTER' not in history:
+        raise ValueError("Missing HISTORY RFFILTER")
+    elif datamode not in ('HIRES', 'LOWRES'):
+        raise ValueError(f"Unknown datamode: {datamode}")
+
+    if table_header.get('XTENSION') != 'BINTABLE':
+        raise ValueError("Second HDU is not a binary table")
+
+    # Read the column layout and the width of a row
+    columns = {}
+    row_width = 0
+    for i in range(1, table_header.get('TFIELDS', 0) + 1):
+        repeat, code, width = _parse_tform(table_header[f'TFORM{i}'])
+        columns[table_header.get(f'TTYPE{i}')] = (repeat, code)
+        row_width += width
+
+    for column, codes in REQUIRED_COLUMNS.items():
+        if column not in columns:
+            raise ValueError(f"Missing column {column}")
+        if columns[column][1] not in codes:
+            raise ValueError(f"Column {column} has type code {columns[column][1]}")
+
+    for column in NUMERIC_COLUMNS:
+        if column in columns and columns[column][1] not in "BIJKED":
+            raise ValueError(f"Column {column} has type code {columns[column][1]}")
+
+    repeat = columns["DATA"][0]
+    if cropped:
+        if channels[1] - channels[0] + 1 != repeat:
+            raise ValueError(f"Channel range {channels} does not match the {repeat} channels in DATA")
+    elif not 0 <= channels[0] <= channels[1] < repeat:
+        raise ValueError(f"Channel range {channels} is outside the {repeat} channels in DATA")
+
+    # Ensure the file holds every row the header promises
+    if row_width != table_header['NAXIS1']:
+        raise ValueError(f"Row width {table_header['NAXIS1']} does not match the columns ({row_width} bytes)")
+
+    if truncated:
+        raise ValueError("File is truncated")
+
+
 class Validation:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str, cache=None):
         '''
         Initialization function for provided file. Responsible for 
         opening the SDFITS file's header and data and initializing 
@@ -14,27 +138,42 @@ class Validation:
         '''
 
         self.filepath = file_path
+        self.cache = cache
+        self.output_path = utils.stage_path(self.filepath, "validated")
+
+        # A cache hit means this exact file was already validated into an output 
+        # that is still on disk, so the file does not need to be read at all
+        self.cached = None
+        if self.cache is not None:
+            self._key = self.cache.key(self.filepath, "validated", precision=utils.PRECISION)
+            self.cached = self.cache.get_output(self._key, self.output_path)
+
+        if self.cached is not None:
+            self.header = None
+            self.data = None
+            return
+
+        # Reject malformed files from their headers before loading any data
+        prevalidate(self.filepath)
 
         with fits.open(self.filepath) as hdul:            
-            # Use astropy's built in verification methods
-            hdul.verify('exception')
+            # Use astropy's built in verification methods unless the pipeline already stamped the file
+            utils.verify(hdul)
 
             self.header = hdul[0].header
             self.data = Table(hdul[1].data)
+            self.data['DATA'] = utils.as_cube(self.data['DATA'])
 
     def _mask_nan_values(self): # TODO revisit to see if necessary
         '''
         Masks values of data that are nonphysical to prevent errors.
         '''
 
-        # Initialize data cube in SDFITS file
-        data_array = np.ma.array(self.data['DATA'])
-
         # Ensure no NaN values in data cube
-        nan_mask = np.isnan(data_array)
+        nan_mask = np.isnan(np.asarray(self.data['DATA']))
         if np.any(nan_mask):
             # Mask values if NaN values exist
-            self.data['DATA'].mask = nan_mask
+            self.data['DATA'] = MaskedColumn(self.data['DATA'], mask=nan_mask)
 
     def _validate_time(self):
         '''
@@ -46,17 +185,14 @@ class Validation:
             dt = Time(self.data["DATE-OBS"], format="isot") - t0
             
         except Exception as e:
-            print("Could not parse observation times!")
+            raise ValueError("Could not parse observation times!") from e
 
     def _validate_physical_values(self):
         '''
         Ensure physical values are indeed physical.
         '''
 
-        columns = ["DURATION", "EXPOSURE", "TSYS", "TCAL", "LST", "ELEVATIO", "TAMBIENT", "PRESSURE",
-                    "HUMIDITY", "RESTFREQ", "FREQRES", "TRGTLONG", "MJD", "UTSECS"]
-
-        for column in columns:
+        for column in NUMERIC_COLUMNS:
             try:
                 # Initialize the array for the given column
                 column_data_array = self.data[column]
@@ -99,18 +235,26 @@ class Validation:
                     start_channel = int(channels[0])
                     stop_channel = int(channels[1])
 
-        self.data['DATA'] = [row[start_channel:stop_channel + 1] for row in self.data['DATA']]
+        self.data['DATA'] = self.data['DATA'][:, start_channel:stop_channel + 1]
 
-    def validate(self):
+    def validate(self, channel_index=False):
         '''
         Validates the data in a file. Ensures all date cards 
         comply to the datetime library standard and that 
         recorded measurements are physical.
 
         Finds the pre- and post- calibration spikes and 
-        removes invalid channels. Saves the polished file.
+        removes invalid channels. Saves the polished file and, 
+        if requested, its channel prefix-sum index. Nothing is 
+        redone if the cache holds an unchanged earlier output.
         '''
 
+        # The output of a cached run is left as it is, only a missing index is rebuilt
+        if self.cached is not None:
+            if channel_index and not utils.has_channel_index(self.output_path):
+                utils.save_channel_index(self.output_path, Table.read(self.output_path, hdu=1))
+            return
+
         # Mask nan values
         self._mask_nan_values()
 
@@ -126,6 +270,11 @@ class Validation:
         # Save the new validated file under the original filepath + _validated
         utils.save(self.filepath, self.header, self.data, "validated")
 
+        if channel_index:
+            utils.save_channel_index(self.output_path, self.data)
+
+        if self.cache is not None:
+            self.cache.put_output(self._key, self.output_path)
 
 if __name__ == "__main__":
     filepath = "C:/Users/starb/Downloads/0144767.fits"